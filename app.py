@@ -2,41 +2,146 @@ from flask import Flask, render_template, request, send_file, jsonify, Response,
 import cv2
 import os
 import uuid
+import json
+import hashlib
+import functools
 
 from utils.config_loader import config
-from utils.model import get_model
+from utils.model import warm_up_models
+from utils.inference_scheduler import inference_model
 from utils.processors import process_image
 from services.stats_service import GlobalTracker
-from services.video_service import generate_frames
+from services.video_service import generate_frames, generate_events, run_video_job
+from services.job_service import VideoJob, JobManager, ProcessJobRunner
 from services.cleanup_service import clear_folders, start_cleanup_worker, delete_file
+from services.cache_service import ResultCache, processing_params
+from services.upload_service import UploadManager, OffsetMismatch, save_stream
+from services.stream_service import PreviewFrame
+from utils.video_io import ffmpeg_available, probe_video
 import subprocess
 import webbrowser
 import threading
 
 # Initialize services
 global_stats = GlobalTracker()
-active_stats = {} # {stream_id: {'detections': N, 'class_counts': {}}}
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = config.get('server.max_content_length_mb', 500) * 1024 * 1024
 app.config['UPLOAD_FOLDER'] = config.get('folders.upload', 'uploads')
 app.config['OUTPUT_FOLDER'] = config.get('folders.output', 'outputs')
 
-# Create and Clear folders on startup
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
-clear_folders([app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER']])
+job_manager = None
+result_cache = None
+upload_manager = None
+_services_started = False
+_services_lock = threading.Lock()
+
+
+def init_services(warm_up=True):
+    """Start uploads, cache, cleanup, the job queue and model warm-up (once).
+
+    Called by the serving process only - app.py's and asgi.py's startup and,
+    as a fallback, the first request - never at import time: worker
+    processes of the 'process' job mode re-import this module (directly or
+    through asgi.py) and must not clear the folders or start services.
+    """
+    global _services_started
+    with _services_lock:
+        if not _services_started:
+            _start_services(warm_up)
+            _services_started = True
+
+
+def _start_services(warm_up):
+    global job_manager, result_cache, upload_manager
+    # Chunked uploads are written straight to disk as they arrive
+    upload_manager = UploadManager(
+        app.config['UPLOAD_FOLDER'],
+        max_bytes=config.get('upload.max_size_mb', config.get('server.max_content_length_mb', 500)) * 1024 * 1024,
+        idle_seconds=config.get('cleanup.max_age_seconds', 900)
+    )
+
+    # Content-addressed results, so re-uploaded files skip inference entirely
+    if config.get('cache.enabled', True):
+        result_cache = ResultCache(
+            config.get('folders.cache', 'cache'),
+            max_entries=config.get('cache.max_entries', 200),
+            max_bytes=config.get('cache.max_size_mb', 2048) * 1024 * 1024
+        )
+
+    # Create and Clear folders on startup
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+    clear_folders([app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER']])
+
+    # Start background cleanup worker
+    start_cleanup_worker(
+        [app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER']], 
+        interval=config.get('cleanup.interval_seconds', 300), 
+        max_age=config.get('cleanup.max_age_seconds', 900),
+        tasks=[result_cache.evict] if result_cache else []
+    )
+
+    # Background video jobs run independently of any /stream viewer.
+    # job_mode 'process' runs each video in its own worker process.
+    job_workers = config.get('processing.job_workers', 2)
+    if config.get('processing.job_mode', 'thread') == 'process':
+        video_worker = ProcessJobRunner(
+            functools.partial(run_video_job, output_folder=app.config['OUTPUT_FOLDER']),
+            max_workers=job_workers,
+            max_tasks_per_child=config.get('processing.job_max_tasks_per_child', 20)
+        )
+    else:
+        video_worker = lambda job: run_video_job(job, app.config['OUTPUT_FOLDER'])
+
+    job_manager = JobManager(
+        worker_fn=video_worker,
+        num_workers=job_workers,
+        on_complete=lambda job, summary: on_video_complete(job, summary),
+        retention_seconds=config.get('cleanup.max_age_seconds', 900)
+    )
+
+    # Load and warm up configured models so the first request skips model load
+    if warm_up:
+        warm_up_models(background=True)
+
+
+@app.before_request
+def ensure_services():
+    init_services()
+
+
+def on_video_complete(job, summary):
+    """Record a finished video in the global stats and the result cache"""
+    global_stats.record(job.user_name, summary.get('detections', 0), summary.get('class_counts', {}))
+    if result_cache is not None and job.cache_key:
+        _, preview = job.latest_frame()
+        result_cache.put(job.cache_key, os.path.join(app.config['OUTPUT_FOLDER'], job.output_filename),
+                         summary, preview=preview.jpeg() if preview is not None else None)
+
+
+def serve_cached_video(stream_id, cache_key, meta, model_choice, user_name):
+    """Recreate a cached video's output files and a finished job for /stream and /status"""
+    job = VideoJob(stream_id, None, model_choice, user_name)
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], job.output_filename)
+    result_cache.restore(cache_key, meta, output_path)
+    summary = {k: meta.get(k) for k in ('detections', 'class_counts', 'frames', 'inference_skipped')}
+    with open(output_path + '.stats.json', 'w') as f:
+        json.dump(dict(summary, filename=job.output_filename), f)
+    with open(output_path + '.done', 'w') as f:
+        f.write('done')
+
+    preview = result_cache.preview(cache_key, meta)
+    if preview:
+        job.publish_frame(PreviewFrame.from_jpeg(preview))
+    job_manager.add_finished(job, summary)
+    return job
 
-# Start background cleanup worker
-start_cleanup_worker(
-    [app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER']], 
-    interval=config.get('cleanup.interval_seconds', 300), 
-    max_age=config.get('cleanup.max_age_seconds', 900)
-)
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', motion_gate=config.get('processing.motion_gate', False),
+                           tiled=config.get('processing.tiled', False))
 
 @app.route('/analytics')
 def analytics():
@@ -47,6 +152,103 @@ def analytics():
 def get_global_stats():
     return jsonify(global_stats.get_stats())
 
+ALLOWED_EXT = {'.png', '.jpg', '.jpeg', '.bmp', '.mp4', '.avi', '.mov', '.mkv'}
+IMAGE_EXT = {'.png', '.jpg', '.jpeg', '.bmp'}
+
+
+def upload_options(data):
+    """Per-upload processing switches from form/JSON fields (default: config)"""
+    def flag(name, default):
+        value = data.get(name)
+        if value is None or value == '':
+            return bool(default)
+        return str(value).lower() in ('1', 'true', 'on', 'yes')
+    return {
+        'motion_gate': flag('motion_gate', config.get('processing.motion_gate', False)),
+        'tiled': flag('tiled', config.get('processing.tiled', False)),
+    }
+
+
+def cache_key_for(file_hash, model_choice, is_image, options=None):
+    if result_cache is None:
+        return None
+    params = processing_params(model_choice, options)
+    params['kind'] = 'image' if is_image else 'video'
+    return ResultCache.make_key(file_hash, params)
+
+
+def video_response(stream_id, model_choice, user_name):
+    return {
+        'success': True,
+        'type': 'video',
+        'stream_id': stream_id,
+        'model': model_choice,
+        'contributor': user_name
+    }
+
+
+def process_saved_upload(filepath, filename, ext, model_choice, user_name, file_hash, options=None):
+    """Serve a fully received upload: cache hit, image inference or a queued video job"""
+    result_filename = f"result_{filename}"
+    result_path = os.path.join(app.config['OUTPUT_FOLDER'], result_filename)
+    is_image = ext in IMAGE_EXT
+
+    # Duplicate upload: answer from the result cache without touching the
+    # model, and without counting the same media in the global stats again
+    cache_key = cache_key_for(file_hash, model_choice, is_image, options)
+    cached = result_cache.get(cache_key) if cache_key is not None else None
+
+    if cached is not None:
+        delete_file(filepath)
+        response = {
+            'type': 'image' if is_image else 'video',
+            'detections': cached.get('detections', 0),
+            'class_counts': cached.get('class_counts', {}),
+            'model': model_choice,
+            'contributor': user_name,
+            'cached': True
+        }
+        if is_image:
+            result_cache.restore(cache_key, cached, result_path)
+            response['filename'] = result_filename
+        else:
+            stream_id = filename[:-len(ext)]
+            serve_cached_video(stream_id, cache_key, cached, model_choice, user_name)
+            response.update({'success': True, 'stream_id': stream_id})
+        return jsonify(response)
+
+    if is_image:
+        # Inference is micro-batched with other concurrent uploads/jobs
+        with inference_model(model_choice) as model:
+            detections_count, class_counts = process_image(model, filepath, result_path,
+                                                           tiled=(options or {}).get('tiled', False))
+        
+        # Record Global Stats
+        global_stats.record(user_name, detections_count, class_counts)
+        if cache_key is not None:
+            result_cache.put(cache_key, result_path,
+                             {'detections': detections_count, 'class_counts': class_counts})
+        
+        # Immediate Cleanup of Original Upload (Image is now in output folder)
+        delete_file(filepath)
+        
+        return jsonify({
+            'type': 'image',
+            'filename': result_filename,
+            'detections': detections_count,
+            'class_counts': class_counts,
+            'model': model_choice,
+            'contributor': user_name
+        })
+
+    # Queue background job; /stream and /status only observe it
+    stream_id = filename[:-len(ext)]
+    job = VideoJob(stream_id, filepath, model_choice, user_name, options)
+    job.cache_key = cache_key
+    job = job_manager.submit(job)
+    return jsonify(video_response(stream_id, model_choice, user_name))
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     try:
@@ -62,77 +264,154 @@ def upload_file():
             return jsonify({'error': 'File tidak dipilih'}), 400
         
         # Validasi ekstensi
-        allowed_ext = {'.png', '.jpg', '.jpeg', '.bmp', '.mp4', '.avi', '.mov', '.mkv'}
         ext = os.path.splitext(file.filename)[1].lower()
-        if ext not in allowed_ext:
+        if ext not in ALLOWED_EXT:
             return jsonify({'error': f'Format tidak didukung: {ext}'}), 400
         
-        # Simpan file
+        # Simpan file, hashing while copying (no second read for the cache key)
         filename = str(uuid.uuid4()) + "_" + file.filename
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Load model
-        model = get_model(model_choice)
-        
-        # Process file
-        result_filename = f"result_{filename}"
-        result_path = os.path.join(app.config['OUTPUT_FOLDER'], result_filename)
-        
-        if ext in ['.png', '.jpg', '.jpeg', '.bmp']:
-            detections_count, class_counts = process_image(model, filepath, result_path)
-            
-            # Record Global Stats
-            global_stats.record(user_name, detections_count, class_counts)
-            
-            # Immediate Cleanup of Original Upload (Image is now in output folder)
-            delete_file(filepath)
-            
-            return jsonify({
-                'type': 'image',
-                'filename': result_filename,
-                'detections': detections_count,
-                'class_counts': class_counts,
-                'model': model_choice,
-                'contributor': user_name
-            })
-        else:
-            # Video stream processing indicator
-            return jsonify({
-                'success': True,
-                'type': 'video',
-                'stream_id': filename.replace(ext, ''),
-                'model': model_choice,
-                'contributor': user_name
-            })
+        hasher = hashlib.sha256()
+        save_stream(file.stream, filepath, hasher)
+
+        return process_saved_upload(filepath, filename, ext, model_choice, user_name, hasher.hexdigest(),
+                                    upload_options(request.form))
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+# Resumable chunked uploads: POST /upload/init, then PUT /upload/<id>?offset=N
+# with raw chunk bodies, then POST /upload/<id>/complete. GET /upload/<id>
+# reports the offset to resume from after a dropped connection.
+@app.route('/upload/init', methods=['POST'])
+def upload_init():
+    try:
+        data = request.get_json(silent=True) or request.form
+        original_name = data.get('filename', '')
+        if not original_name:
+            return jsonify({'error': 'File tidak dipilih'}), 400
+        ext = os.path.splitext(original_name)[1].lower()
+        if ext not in ALLOWED_EXT:
+            return jsonify({'error': f'Format tidak didukung: {ext}'}), 400
+
+        filename = str(uuid.uuid4()) + "_" + original_name
+        upload_id = filename[:-len(ext)]
+        size = data.get('size')
+        session = upload_manager.create(
+            upload_id, filename,
+            data.get('model', 'v8'), data.get('contributor', 'EcoCitizen'),
+            size=int(size) if size not in (None, '') else None,
+            options=upload_options(data)
+        )
+        return jsonify({
+            'upload_id': session.upload_id,
+            'offset': session.received,
+            'chunk_size': config.get('upload.chunk_size_mb', 8) * 1024 * 1024
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+def maybe_start_early(session):
+    """Start a video job on a partial upload once its header is decodable.
+
+    The content hash is only known at /complete, so an early job cannot be
+    answered from the result cache, and it decodes front to back instead of
+    in parallel segments.
+    """
+    ext = os.path.splitext(session.filename)[1].lower()
+    if (session.job is not None or session.probed or ext in IMAGE_EXT
+            or not config.get('upload.early_start', True)
+            or config.get('processing.job_mode', 'thread') != 'thread'
+            or session.received < config.get('upload.early_start_mb', 8) * 1024 * 1024):
+        return
+    # Probe once: a header that is unreadable now (e.g. MP4 with the moov
+    # atom at the end) only becomes readable with the last chunk
+    session.probed = True
+    if not ffmpeg_available() or probe_video(session.filepath) is None:
+        return
+    job = VideoJob(session.upload_id, session.filepath, session.model_choice, session.user_name, session.options)
+    job.source = session
+    session.job = job_manager.submit(job)
+    print(f"Upload {session.upload_id}: decoding started after {session.received} bytes")
+
+
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    session = upload_manager.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload tidak ditemukan'}), 404
+    try:
+        offset = int(request.args.get('offset', session.received))
+        received = session.append(request.stream, offset, limit=upload_manager.max_bytes)
+    except OffsetMismatch as e:
+        return jsonify({'error': str(e), 'offset': e.expected}), 409
+    except Exception as e:
+        return jsonify({'error': str(e), 'offset': session.received}), 400
+
+    maybe_start_early(session)
+    response = {'offset': received}
+    if session.job is not None:
+        response['stream_id'] = session.job.stream_id
+    return jsonify(response)
+
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def upload_progress(upload_id):
+    session = upload_manager.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload tidak ditemukan'}), 404
+    return jsonify({'offset': session.received, 'size': session.size,
+                    'stream_id': session.job.stream_id if session.job else None})
+
+
+@app.route('/upload/<upload_id>', methods=['DELETE'])
+def upload_cancel(upload_id):
+    session = upload_manager.remove(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload tidak ditemukan'}), 404
+    session.abort()
+    if session.job is None or session.job.finished:
+        delete_file(session.filepath)
+    return jsonify({'cancelled': True})
+
+
+@app.route('/upload/<upload_id>/complete', methods=['POST'])
+def upload_complete(upload_id):
+    session = upload_manager.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload tidak ditemukan'}), 404
+    try:
+        file_hash = session.digest()
+        upload_manager.remove(upload_id)
+        ext = os.path.splitext(session.filename)[1].lower()
+        if session.job is not None and session.job.status == 'error':
+            # The early decode gave up (e.g. the client paused); the file is whole now
+            print(f"Upload {upload_id}: early job failed ({session.job.error}), processing the complete file")
+            session.job = None
+        if session.job is not None:
+            # Already decoding; register the result in the cache when it finishes
+            session.job.cache_key = cache_key_for(file_hash, session.model_choice, False, session.options)
+            session.finish()
+            return jsonify(video_response(session.upload_id, session.model_choice, session.user_name))
+        session.finish()
+        return process_saved_upload(session.filepath, session.filename, ext,
+                                    session.model_choice, session.user_name, file_hash, session.options)
+    except Exception as e:
+        return jsonify({'error': str(e), 'offset': session.received}), 400
+
 @app.route('/stream/<stream_id>')
 def stream_video(stream_id):
-    """Live stream video processing - real-time output"""
-    filepath = None
-    
-    # Find uploaded file
-    for ext in ['.mp4', '.avi', '.mov', '.mkv']:
-        test_path = os.path.join(app.config['UPLOAD_FOLDER'], stream_id + ext)
-        if os.path.exists(test_path):
-            filepath = test_path
-            break
-    
-    if not filepath:
+    """Live view of a background video job - latest annotated frames"""
+    job = job_manager.get(stream_id)
+    if job is None:
         return jsonify({'error': 'File tidak ditemukan'}), 404
-    
-    # Capture choices from request Context
-    model_choice = request.args.get('model', 'v8')
-    user_name = request.args.get('contributor', 'EcoCitizen')
 
+    # Optional per-viewer limits, e.g. /stream/<id>?kbps=500&width=480 over a slow tunnel
     return Response(
-        generate_frames(
-            filepath, model_choice, user_name, stream_id, 
-            app.config, global_stats, active_stats
-        ),
+        generate_frames(job, target_kbps=request.args.get('kbps', type=int),
+                        max_width=request.args.get('width', type=int)),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
@@ -160,45 +439,57 @@ def serve_image(filename):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/status/<stream_id>')
-def stream_status(stream_id):
-    """Check whether processed output for stream_id is ready for download"""
+def status_payload(stream_id):
+    """Status dict for stream_id: live job state, else the files it left behind"""
+    # 1. Prioritize In-Memory Job State
+    job = job_manager.get(stream_id)
+    if job is not None:
+        return job.to_status()
+
     output_filename = f"result_{stream_id}.mp4"
     output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
     marker_file = output_path + '.done'
     stats_file = output_path + '.stats.json'
     
     is_ready = os.path.exists(marker_file)
-    
-    # 1. Prioritize In-Memory Active Stats
-    if stream_id in active_stats:
-        s = active_stats[stream_id]
-        return jsonify({
-            'ready': is_ready,
-            'filename': output_filename,
-            'detections': s['detections'],
-            'class_counts': s['class_counts'],
-            'status': 'processing' if not is_ready else 'done'
-        })
 
     # 2. Fallback to stats file
     stats = {'detections': 0, 'class_counts': {}, 'frames': 0}
     if os.path.exists(stats_file):
         try:
-            import json
             with open(stats_file, 'r') as f:
                 stats = json.load(f)
         except Exception as e:
             print(f"Error reading stats: {e}")
     
-    return jsonify({
+    return {
         'ready': is_ready, 
         'filename': output_filename,
         'detections': stats.get('detections', 0),
         'class_counts': stats.get('class_counts', {}),
         'frames': stats.get('frames', 0),
+        'inference_skipped': stats.get('inference_skipped', 0),
         'status': 'done' if is_ready else 'processing'
-    })
+    }
+
+
+@app.route('/status/<stream_id>')
+def stream_status(stream_id):
+    """Check whether processed output for stream_id is ready for download"""
+    return jsonify(status_payload(stream_id))
+
+
+@app.route('/events/<stream_id>')
+def stream_events(stream_id):
+    """Server-Sent Events: pushes the /status payload whenever the job advances"""
+    job = job_manager.get(stream_id)
+    if job is None:
+        # No live job: a single event from the files on disk, then close
+        events = iter([f"data: {json.dumps(status_payload(stream_id))}\n\n"])
+    else:
+        events = generate_events(job, min_interval=config.get('server.sse_interval_ms', 200) / 1000.0)
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
     # Start Streamlit in Background
@@ -234,6 +525,9 @@ if __name__ == '__main__':
 
     threading.Thread(target=run_streamlit, daemon=True).start()
 
+    # The reloader's parent process never serves requests: no model warm-up there
+    init_services(warm_up=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
+
     app.run(
         debug=config.get('server.debug', True), 
         use_reloader=True, 
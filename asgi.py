@@ -0,0 +1,84 @@
+"""
+ASGI serving mode for EcoVision.
+
+/stream, /status and /events are served natively on the event loop (frame
+and progress delivery wait on asyncio events, status file reads run in the
+thread pool); every other route is the unchanged Flask app behind a WSGI
+adapter, whose handlers (uploads, image inference) run on a bounded
+thread pool. Services (job queue, cache, cleanup, model warm-up) start
+with the app, not on import, so 'process' job workers stay inert.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+or:
+    python asgi.py
+"""
+import json
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from utils.config_loader import config
+from services.video_service import generate_frames_async, generate_events_async
+import app as flask_module
+
+
+async def stream_video(request):
+    """Live view of a background video job - latest annotated frames"""
+    job = flask_module.job_manager.get(request.path_params['stream_id'])
+    if job is None:
+        return JSONResponse({'error': 'File tidak ditemukan'}, status_code=404)
+    kbps, width = request.query_params.get('kbps'), request.query_params.get('width')
+    frames = generate_frames_async(job, target_kbps=int(kbps) if kbps and kbps.isdigit() else None,
+                                   max_width=int(width) if width and width.isdigit() else None)
+    return StreamingResponse(frames, media_type='multipart/x-mixed-replace; boundary=frame')
+
+
+async def stream_status(request):
+    stream_id = request.path_params['stream_id']
+    job = flask_module.job_manager.get(stream_id)
+    if job is not None:
+        return JSONResponse(job.to_status())
+    # Finished and forgotten jobs fall back to files on disk
+    return JSONResponse(await run_in_threadpool(flask_module.status_payload, stream_id))
+
+
+async def stream_events(request):
+    """Server-Sent Events: pushes the /status payload whenever the job advances"""
+    stream_id = request.path_params['stream_id']
+    job = flask_module.job_manager.get(stream_id)
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if job is None:
+        payload = await run_in_threadpool(flask_module.status_payload, stream_id)
+        return StreamingResponse(iter([f"data: {json.dumps(payload)}\n\n"]),
+                                 media_type='text/event-stream', headers=headers)
+    interval = config.get('server.sse_interval_ms', 200) / 1000.0
+    return StreamingResponse(generate_events_async(job, min_interval=interval),
+                             media_type='text/event-stream', headers=headers)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(flask_module.init_services)
+    yield
+
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/stream/{stream_id}', stream_video),
+    Route('/status/{stream_id}', stream_status),
+    Route('/events/{stream_id}', stream_events),
+    Mount('/', WSGIMiddleware(flask_module.app, workers=config.get('server.asgi_wsgi_workers', 16))),
+])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(
+        "asgi:app",
+        host=config.get('server.host', '0.0.0.0'),
+        port=config.get('server.port', 5000)
+    )
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark alur frame per video: resize/copy/annotate sebelum dan sesudah "resize once".
+
+Legacy flow: inference resize, raw copy, annotated copy, drawing on the
+source-resolution frame, then a resize to video_target_width for the writer.
+New flow: _resize_once (one resize per image, output taken from the
+inference image) and the cached-sprite renderer at output resolution.
+Detections are synthetic (fixed boxes per frame) so only the frame flow is
+timed; decoding happens up front and is not included.
+
+Usage (from repo root):
+    python scripts/benchmark_frame_flow.py --frames 120 --boxes 30
+    python scripts/benchmark_frame_flow.py --width 2560   # upscaled to 2K
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.config_loader import config
+from utils.annotation import AnnotationRenderer
+from services.video_service import _resize_once, _output_size
+
+
+def legacy_draw_box(frame, x1, y1, x2, y2, label, w_orig):
+    """Per-box drawing used before utils/annotation.py (for reference)"""
+    thickness = max(1, int(w_orig / 800))
+    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), thickness)
+    font_scale = w_orig / 2400
+    (w_l, h_l), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    label_height = int(18 * font_scale)
+    y1_label = max(y1 - label_height, 0)
+    cv2.rectangle(frame, (x1, y1_label), (x1 + w_l, y1_label + label_height), (0, 255, 0), -1)
+    cv2.putText(frame, label, (x1, y1_label + int(14 * font_scale)),
+                cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness)
+
+
+def legacy_flow(frame, inf_width, output_size, dets):
+    h, w = frame.shape[:2]
+    raw_frame = frame.copy()
+    if w > inf_width:
+        inf_frame = cv2.resize(frame, (inf_width, int(h * inf_width / w)))
+    else:
+        inf_frame = frame.copy()
+    annotated = raw_frame.copy()
+    for (x1, y1, x2, y2), label, conf, oid in dets:
+        legacy_draw_box(annotated, x1, y1, x2, y2, f"{label} {conf:.2f}", w)
+        cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+        cv2.putText(annotated, f"ID {oid}", (cx - 10, cy - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+        cv2.circle(annotated, (cx, cy), 3, (0, 255, 0), -1)
+    cv2.putText(annotated, "FPS: 30.0", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
+    out = cv2.resize(annotated, output_size)
+    return inf_frame, out
+
+
+def new_flow(frame, inf_width, output_size, dets, renderer):
+    inf_frame, _, out = _resize_once(frame, inf_width, output_size)
+    scale = output_size[0] / frame.shape[1]
+    boxes = [d[0] for d in dets]
+    renderer.draw_boxes(out, boxes, [d[1] for d in dets], [d[2] for d in dets], scale=scale)
+    renderer.draw_tracks(out, [(d[3], ((d[0][0] + d[0][2]) // 2, (d[0][1] + d[0][3]) // 2)) for d in dets], scale=scale)
+    renderer.draw_fps(out, 30.0)
+    return inf_frame, out
+
+
+def make_detections(width, height, n, frames, seed=0):
+    rng = np.random.default_rng(seed)
+    labels = ['plastic', 'bottle', 'net', 'fish']
+    scene = []
+    for f in range(frames):
+        xy = rng.uniform([0, 0], [width * 0.9, height * 0.9], size=(n, 2)).astype(int)
+        wh = rng.uniform(20, width * 0.08, size=(n, 2)).astype(int)
+        scene.append([((x, y, x + bw, y + bh), labels[i % len(labels)], float(rng.uniform(0.2, 1.0)), i)
+                      for i, ((x, y), (bw, bh)) in enumerate(zip(xy.tolist(), wh.tolist()))])
+    return scene
+
+
+def run(flow, frames, scene, *args):
+    """Mean seconds and mean peak traced bytes per frame (separate passes,
+    so tracemalloc overhead stays out of the timings)"""
+    times, peaks = [], []
+    for frame, dets in zip(frames, scene):
+        frame = frame.copy()  # new flow draws in place; keep inputs pristine (untimed)
+        start = time.perf_counter()
+        flow(frame, *args[:2], dets, *args[2:])
+        times.append(time.perf_counter() - start)
+    for frame, dets in zip(frames, scene):
+        frame = frame.copy()
+        tracemalloc.start()
+        flow(frame, *args[:2], dets, *args[2:])
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return float(np.mean(times)), float(np.mean(peaks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', nargs='*', default=[os.path.join('video', f) for f in sorted(os.listdir('video'))
+                                                        if f.endswith('.mp4')])
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--boxes', type=int, default=30)
+    parser.add_argument('--width', type=int, default=0,
+                        help='resize decoded frames to this width first, e.g. 2560 to emulate 2K footage')
+    args = parser.parse_args()
+
+    inf_width = config.get('processing.max_width_v8', 1024)
+    renderer = AnnotationRenderer()
+    print(f"{'video':<24}{'size':>11}{'flow':>8}{'ms/frame':>10}{'peak MB':>9}")
+    for path in args.videos:
+        cap = cv2.VideoCapture(path)
+        frames = []
+        while len(frames) < args.frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if args.width:
+                frame = cv2.resize(frame, (args.width, int(frame.shape[0] * args.width / frame.shape[1])))
+            frames.append(frame)
+        cap.release()
+        if not frames:
+            print(f"{path}: no frames")
+            continue
+        h, w = frames[0].shape[:2]
+        output_size = _output_size(w, h)
+        scene = make_detections(w, h, args.boxes, len(frames))
+        new_flow(frames[0].copy(), inf_width, output_size, scene[0], renderer)  # render sprites once
+        for name, flow, extra in (('legacy', legacy_flow, ()), ('new', new_flow, (renderer,))):
+            seconds, peak = run(flow, frames, scene, inf_width, output_size, *extra)
+            print(f"{os.path.basename(path)[:23]:<24}{f'{w}x{h}':>11}{name:>8}{seconds * 1000:>10.2f}{peak / 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
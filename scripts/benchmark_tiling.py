@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Bandingkan latency dan recall inferensi standar vs tiled (SAHI-style) pada klip di video/.
+
+'standard' mengecilkan frame ke processing.max_width_v8 dan menjalankan satu
+predict per frame (batch processing.batch_size). 'tiled-N' mengecilkan frame ke
+processing.tile_max_width lalu memotongnya menjadi tile N px (plus satu view
+full-frame) yang dijalankan dalam batch dan digabung dengan NMS lintas tile.
+
+Tidak ada label ground truth, jadi recall dihitung terhadap gabungan (pool)
+deteksi semua konfigurasi setelah NMS: objek yang ditemukan salah satu mode
+dianggap nyata (IoU >= 0.5, kelas sama). 'small' = recall untuk objek pool
+dengan sisi terpendek < --small px (resolusi sumber). --sequential menambah
+baris tiled dengan batch 1, untuk melihat hemat waktu dari batching tile.
+
+Usage (from repo root):
+    python scripts/benchmark_tiling.py --frames 30 --tile-sizes 640,480,320
+    python scripts/benchmark_tiling.py --width 2560 --sequential   # upscaled to 2K
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.config_loader import config
+from utils.model import get_model, infer_batch
+from utils.detections import extract_detections
+from utils.tiling import TileSpec, infer_tiled, merge_detections, scale_detections
+from benchmark_variants import match_counts
+
+
+def read_frames(path, max_frames, width=0):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if width:
+            frame = cv2.resize(frame, (width, int(frame.shape[0] * width / frame.shape[1])))
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def shrink(frames, max_width):
+    """Frames at most max_width wide and the factor back to source coordinates"""
+    h, w = frames[0].shape[:2]
+    if w <= max_width:
+        return frames, 1.0
+    size = (max_width, int(h * max_width / w))
+    return [cv2.resize(f, size, interpolation=cv2.INTER_AREA) for f in frames], w / max_width
+
+
+def run_standard(model, frames, batch_size):
+    small, back = shrink(frames, config.get('processing.max_width_v8', 1024))
+    infer_batch(model, small[:1], batch_size=1)  # warm-up
+    start = time.perf_counter()
+    results = infer_batch(model, small, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    names = getattr(model, 'names', None)
+    return [extract_detections(r, names, back) for r in results], elapsed, 1
+
+
+def run_tiled(model, frames, spec, batch_size):
+    small, back = shrink(frames, config.get('processing.tile_max_width', 1920))
+    tiles = len(spec.slice(small[0])[0])
+    infer_tiled(model, small[:1], spec=spec, batch_size=batch_size)  # warm-up
+    start = time.perf_counter()
+    dets = [scale_detections(d, back) for f in small
+            for d in infer_tiled(model, [f], spec=spec, batch_size=batch_size)]
+    elapsed = time.perf_counter() - start
+    return dets, elapsed, tiles
+
+
+def small_only(dets, min_side):
+    sides = np.minimum(dets['xyxy'][:, 2] - dets['xyxy'][:, 0], dets['xyxy'][:, 3] - dets['xyxy'][:, 1])
+    keep = np.nonzero(sides < min_side)[0]
+    return {'xyxy': dets['xyxy'][keep], 'conf': dets['conf'][keep], 'cls': dets['cls'][keep],
+            'labels': [dets['labels'][i] for i in keep.tolist()]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='v8')
+    parser.add_argument('--videos', default=os.path.join('video', '*.mp4'))
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--width', type=int, default=0,
+                        help='resize decoded frames to this width first, e.g. 2560 to emulate 2K footage')
+    parser.add_argument('--tile-sizes', default='640,480,320')
+    parser.add_argument('--overlap', type=float, default=config.get('processing.tile_overlap', 0.2))
+    parser.add_argument('--small', type=int, default=32, help='objects with a shorter side are "small"')
+    parser.add_argument('--sequential', action='store_true', help='also run each tile size with batch size 1')
+    args = parser.parse_args()
+
+    model = get_model(args.model)
+    batch_size = config.get('processing.batch_size', 4)
+    tile_batch = config.get('processing.tile_batch_size', 16)
+    modes = [('standard', lambda frames: run_standard(model, frames, batch_size))]
+    for size in [int(s) for s in args.tile_sizes.split(',') if s.strip()]:
+        spec = TileSpec(tile_size=size, overlap=args.overlap,
+                        full_frame=config.get('processing.tile_full_frame', True),
+                        nms_threshold=config.get('processing.tile_nms_threshold', 0.5),
+                        metric=config.get('processing.tile_nms_metric', 'ios'))
+        modes.append((f'tiled-{size}', lambda frames, spec=spec: run_tiled(model, frames, spec, tile_batch)))
+        if args.sequential:
+            modes.append((f'tiled-{size}-seq', lambda frames, spec=spec: run_tiled(model, frames, spec, 1)))
+
+    print(f"{'video':<24} {'mode':<16} {'tiles':>5} {'ms/frame':>9} {'ms/tile':>8} {'det/frame':>10} "
+          f"{'recall':>7} {'small':>7}")
+    print("-" * 94)
+    for path in sorted(glob.glob(args.videos)):
+        frames = read_frames(path, args.frames, args.width)
+        if not frames:
+            continue
+        runs = [(name,) + run(frames) for name, run in modes]
+        # Pooled reference: every object any mode found, duplicates merged
+        pool = [merge_detections([r[1][i] for r in runs], threshold=0.5, metric='iou') for i in range(len(frames))]
+        pool_small = [small_only(p, args.small) for p in pool]
+        n_pool = sum(len(p['labels']) for p in pool)
+        n_small = sum(len(p['labels']) for p in pool_small)
+        for name, dets, elapsed, tiles in runs:
+            tp = sum(match_counts(p, d) for p, d in zip(pool, dets))
+            tp_small = sum(match_counts(p, d) for p, d in zip(pool_small, dets))
+            ms = elapsed * 1000 / len(frames)
+            print(f"{os.path.basename(path)[:24]:<24} {name:<16} {tiles:>5} {ms:>9.1f} {ms / tiles:>8.1f} "
+                  f"{sum(len(d['labels']) for d in dets) / len(frames):>10.2f} "
+                  f"{tp / n_pool if n_pool else 1.0:>7.3f} {tp_small / n_small if n_small else 1.0:>7.3f}")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark untuk CentroidTracker.update (dan SortTracker) pada 10/100/1000 objek per frame.
+
+Usage (from repo root):
+    python scripts/benchmark_tracking.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.tracking import CentroidTracker, SortTracker
+
+
+def legacy_distance_matrix(object_centroids, input_centroids):
+    """Nested-loop distance matrix used by the original tracker (for reference)"""
+    D = np.zeros((len(object_centroids), len(input_centroids)))
+    for i in range(len(object_centroids)):
+        for j in range(len(input_centroids)):
+            D[i, j] = np.linalg.norm(np.array(object_centroids[i]) - input_centroids[j])
+    return D
+
+
+def make_scene(n, frames, width=1920, height=1080, seed=0):
+    """n boxes drifting a few pixels per frame, as (frames, n, 4) int array"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([0, 0], [width, height], size=(n, 2))
+    velocity = rng.normal(0, 2.0, size=(n, 2))
+    half = rng.uniform(8, 30, size=(n, 2))
+    scene = []
+    for _ in range(frames):
+        centers = centers + velocity + rng.normal(0, 0.5, size=(n, 2))
+        scene.append(np.hstack([centers - half, centers + half]).astype(int))
+    return scene
+
+
+def time_tracker(scene, matcher):
+    if matcher == 'sort':
+        ct = SortTracker(max_disappeared=40)
+    else:
+        ct = CentroidTracker(max_disappeared=40, max_distance=50, matcher=matcher)
+    names = ['plastic'] * len(scene[0])
+    ct.update(scene[0], names)  # registration frame, not timed
+    start = time.perf_counter()
+    for rects in scene[1:]:
+        ct.update(rects, names)
+    return (time.perf_counter() - start) / (len(scene) - 1), ct.next_object_id
+
+
+def time_legacy_distances(scene):
+    prev = ((scene[0][:, :2] + scene[0][:, 2:]) / 2).astype(int)
+    start = time.perf_counter()
+    for rects in scene[1:]:
+        curr = ((rects[:, :2] + rects[:, 2:]) / 2).astype(int)
+        legacy_distance_matrix(list(prev), curr)
+        prev = curr
+    return (time.perf_counter() - start) / (len(scene) - 1)
+
+
+if __name__ == '__main__':
+    print(f"{'objects':>8} | {'legacy D only':>14} | {'greedy':>10} | {'hungarian':>10} | {'sort':>10} | unique IDs (greedy/hungarian/sort)")
+    print("-" * 100)
+    for n in (10, 100, 1000):
+        frames = 30 if n < 1000 else 6
+        scene = make_scene(n, frames)
+        # The legacy O(n*m) Python loop is too slow to run many frames at 1000 objects
+        legacy = time_legacy_distances(scene[:3] if n >= 1000 else scene)
+        greedy, ids_greedy = time_tracker(scene, 'greedy')
+        hungarian, ids_hungarian = time_tracker(scene, 'hungarian')
+        sort_time, ids_sort = time_tracker(scene, 'sort')
+        print(f"{n:>8} | {legacy * 1000:>11.2f} ms | {greedy * 1000:>7.2f} ms | {hungarian * 1000:>7.2f} ms | "
+              f"{sort_time * 1000:>7.2f} ms | {ids_greedy}/{ids_hungarian}/{ids_sort}")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Bandingkan kecepatan dan akurasi varian model (FP32 / FP16 / INT8) pada klip di video/.
+
+Deteksi varian pertama (default 'v8', FP32) dipakai sebagai referensi; untuk varian
+lain dihitung precision/recall terhadap referensi (IoU >= 0.5, kelas sama).
+
+Usage (from repo root):
+    python scripts/benchmark_variants.py --variants v8,v8-fp16,v8-int8 --frames 150
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.config_loader import config
+from utils.model import get_model, infer_batch
+from utils.detections import extract_detections
+from utils.tracking import iou_matrix, greedy_match
+
+
+def read_frames(path, max_frames, max_width):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        h, w = frame.shape[:2]
+        if w > max_width:
+            frame = cv2.resize(frame, (max_width, int(h * max_width / w)))
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run_variant(variant, frames, batch_size):
+    model = get_model(variant)
+    infer_batch(model, frames[:batch_size], batch_size=batch_size)  # warm-up
+    start = time.perf_counter()
+    results = infer_batch(model, frames, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    names = getattr(model, 'names', None)
+    return [extract_detections(r, names) for r in results], len(frames) / max(elapsed, 1e-9)
+
+
+def match_counts(reference, candidate, iou_threshold=0.5):
+    """True positives of candidate vs reference for one frame (same class, IoU gate)"""
+    if len(reference['labels']) == 0 or len(candidate['labels']) == 0:
+        return 0
+    cost = 1.0 - iou_matrix(reference['xyxy'], candidate['xyxy'])
+    cost[reference['cls'][:, None] != candidate['cls'][None, :]] = np.inf
+    rows, _ = greedy_match(cost, 1.0 - iou_threshold)
+    return len(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants', default='v8,v8-fp16,v8-int8')
+    parser.add_argument('--videos', default=os.path.join('video', '*.mp4'))
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--batch-size', type=int, default=config.get('processing.batch_size', 4))
+    args = parser.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(',') if v.strip()]
+    max_width = config.get('processing.max_width_v8', 1024)
+
+    print(f"{'video':<24} {'variant':<12} {'fps':>8} {'det/frame':>10} {'precision':>10} {'recall':>8}")
+    print("-" * 76)
+    for path in sorted(glob.glob(args.videos)):
+        frames = read_frames(path, args.frames, max_width)
+        if not frames:
+            continue
+        reference = None
+        for variant in variants:
+            dets, fps = run_variant(variant, frames, args.batch_size)
+            n_det = sum(len(d['labels']) for d in dets)
+            if reference is None:
+                reference = dets
+                precision = recall = 1.0
+            else:
+                tp = sum(match_counts(r, d) for r, d in zip(reference, dets))
+                n_ref = sum(len(r['labels']) for r in reference)
+                precision = tp / n_det if n_det else 1.0
+                recall = tp / n_ref if n_ref else 1.0
+            print(f"{os.path.basename(path)[:24]:<24} {variant:<12} {fps:>8.1f} {n_det / len(frames):>10.2f} "
+                  f"{precision:>10.3f} {recall:>8.3f}")
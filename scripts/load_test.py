@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Load test lokal: banyak viewer /stream dan poller /status terhadap satu job video.
+
+Uploads one clip, then opens --viewers concurrent MJPEG connections and
+--pollers clients hitting /status every --interval seconds for --duration
+seconds. Reports how many viewers actually got frames, frames/s per viewer
+and /status latency, so the threaded Flask server and the ASGI mode can be
+compared on the same machine:
+
+    python app.py                      # then: python scripts/load_test.py
+    uvicorn asgi:app --port 5000       # then: python scripts/load_test.py
+"""
+import os
+import time
+import uuid
+import json
+import asyncio
+import argparse
+import urllib.request
+from urllib.parse import urlparse
+
+
+def upload_clip(base_url, path, model='v8'):
+    """POST a video to /upload (multipart, stdlib only) and return its stream_id"""
+    boundary = uuid.uuid4().hex
+    with open(path, 'rb') as f:
+        payload = f.read()
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="model"\r\n\r\n{model}\r\n'.encode(),
+        f'--{boundary}\r\nContent-Disposition: form-data; name="contributor"\r\n\r\nloadtest\r\n'.encode(),
+        (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{os.path.basename(path)}"\r\n'
+         f'Content-Type: application/octet-stream\r\n\r\n').encode() + payload + b'\r\n',
+        f'--{boundary}--\r\n'.encode(),
+    ]
+    request = urllib.request.Request(f'{base_url}/upload', data=b''.join(parts), method='POST',
+                                     headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    with urllib.request.urlopen(request, timeout=120) as r:
+        return json.load(r)['stream_id']
+
+
+async def http_get(host, port, path, read_body=True):
+    """Minimal HTTP/1.1 GET; returns (status, reader, writer) or (status, body)"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    status = int(status_line.split()[1]) if status_line else 0
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    if not read_body:
+        return status, reader, writer
+    body = await reader.read()
+    writer.close()
+    return status, body
+
+
+async def viewer(host, port, stream_id, deadline, stats):
+    try:
+        status, reader, writer = await asyncio.wait_for(
+            http_get(host, port, f'/stream/{stream_id}', read_body=False), timeout=10)
+    except Exception:
+        stats['viewer_errors'] += 1
+        return
+    frames = 0
+    try:
+        while time.perf_counter() < deadline:
+            line = await asyncio.wait_for(reader.readline(), timeout=max(0.1, deadline - time.perf_counter()))
+            if not line:
+                break
+            if line.startswith(b'--frame'):
+                frames += 1
+    except asyncio.TimeoutError:
+        pass
+    except Exception:
+        stats['viewer_errors'] += 1
+    finally:
+        writer.close()
+    stats['viewer_frames'].append(frames)
+
+
+async def poller(host, port, stream_id, deadline, interval, stats):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            status, _ = await asyncio.wait_for(http_get(host, port, f'/status/{stream_id}'), timeout=10)
+            if status != 200:
+                stats['poll_errors'] += 1
+            else:
+                stats['poll_latency'].append(time.perf_counter() - start)
+        except Exception:
+            stats['poll_errors'] += 1
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - start)))
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(args):
+    url = urlparse(args.url)
+    host, port = url.hostname, url.port or 80
+    stream_id = args.stream_id or upload_clip(args.url, args.video)
+    print(f"Stream {stream_id}: {args.viewers} viewers, {args.pollers} pollers, {args.duration}s")
+
+    stats = {'viewer_frames': [], 'viewer_errors': 0, 'poll_latency': [], 'poll_errors': 0}
+    deadline = time.perf_counter() + args.duration
+    tasks = [viewer(host, port, stream_id, deadline, stats) for _ in range(args.viewers)]
+    tasks += [poller(host, port, stream_id, deadline, args.interval, stats) for _ in range(args.pollers)]
+    await asyncio.gather(*tasks)
+
+    served = [f for f in stats['viewer_frames'] if f > 0]
+    print(f"viewers receiving frames: {len(served)}/{args.viewers} (errors: {stats['viewer_errors']})")
+    if served:
+        print(f"frames/s per viewer: mean {sum(served) / len(served) / args.duration:.1f}, "
+              f"min {min(served) / args.duration:.1f}")
+    lat = stats['poll_latency']
+    print(f"/status: {len(lat)} ok, {stats['poll_errors']} errors, "
+          f"p50 {percentile(lat, 0.5) * 1000:.1f} ms, p95 {percentile(lat, 0.95) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--video', default=os.path.join('video', '2K0167OUTUM109.mp4'))
+    parser.add_argument('--stream-id', help='observe an existing job instead of uploading --video')
+    parser.add_argument('--viewers', type=int, default=200)
+    parser.add_argument('--pollers', type=int, default=200)
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between /status polls per poller')
+    parser.add_argument('--duration', type=float, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args))
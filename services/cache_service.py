@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+from utils.config_loader import config
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hex SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def processing_params(model_choice, options=None):
+    """Settings that change what a result looks like; part of every cache key"""
+    keys = ('inference_conf', 'imgsz', 'max_width_v8', 'max_width_rtdetr', 'video_target_width',
+            'detection_stride', 'tracker', 'tracker_matcher', 'tracker_class_aware',
+            'sort_iou_threshold', 'sort_min_hits', 'annotation_conf_step', 'decode_backend',
+            'motion_gate_threshold', 'motion_gate_pixel_delta', 'motion_gate_max_skip',
+            'tile_max_width', 'tile_size', 'tile_overlap', 'tile_full_frame', 'tile_nms_threshold',
+            'tile_nms_metric')
+    params = {k: config.get(f'processing.{k}') for k in keys}
+    params.update(options or {})  # per-upload switches
+    params['model'] = model_choice
+    params['backend'] = config.get('models.backend', 'torch')
+    return params
+
+
+class ResultCache:
+    """Content-addressed store of finished results.
+
+    Entries are keyed by the hash of the uploaded bytes plus the model and
+    processing settings, and live in ``folder/<key>/`` as the annotated
+    artifact, an optional preview frame and ``meta.json`` (detections,
+    class counts, ...). Eviction is LRU, bounded by entry count and total
+    size; ``evict()`` runs from the cleanup worker as well as after puts.
+    """
+
+    def __init__(self, folder, max_entries=200, max_bytes=2 * 1024 ** 3):
+        self.folder = folder
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {key: meta}, least recently used first
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the index from disk, ordered by last access"""
+        found = []
+        for key in os.listdir(self.folder):
+            meta_path = os.path.join(self.folder, key, 'meta.json')
+            try:
+                with open(meta_path, 'r') as f:
+                    found.append((os.path.getmtime(meta_path), key, json.load(f)))
+            except Exception:
+                shutil.rmtree(os.path.join(self.folder, key), ignore_errors=True)
+        for _, key, meta in sorted(found):
+            self._entries[key] = meta
+        if found:
+            print(f"Cache: loaded {len(found)} cached results")
+
+    @staticmethod
+    def make_key(file_hash, params):
+        raw = json.dumps([file_hash, params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.folder, key)
+
+    def get(self, key):
+        """Meta dict of a cached result (marking it recently used), or None"""
+        with self._lock:
+            meta = self._entries.get(key)
+            if meta is None:
+                return None
+            artifact = os.path.join(self._entry_dir(key), meta['artifact'])
+            if not os.path.exists(artifact):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        try:
+            os.utime(os.path.join(self._entry_dir(key), 'meta.json'))
+        except OSError:
+            pass
+        return dict(meta)
+
+    def restore(self, key, meta, dest_path):
+        """Materialize the cached artifact at dest_path (hard link when possible)"""
+        src = os.path.join(self._entry_dir(key), meta['artifact'])
+        try:
+            os.link(src, dest_path)
+        except OSError:
+            shutil.copyfile(src, dest_path)
+        return dest_path
+
+    def preview(self, key, meta):
+        """Cached preview frame bytes, if one was stored"""
+        name = meta.get('preview')
+        if not name:
+            return None
+        try:
+            with open(os.path.join(self._entry_dir(key), name), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key, artifact_path, meta, preview=None):
+        """Copy artifact_path (and preview bytes) into the cache under key"""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp{threading.get_ident()}"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            meta = dict(meta)
+            meta['artifact'] = 'artifact' + os.path.splitext(artifact_path)[1]
+            shutil.copyfile(artifact_path, os.path.join(tmp_dir, meta['artifact']))
+            if preview:
+                meta['preview'] = 'preview.bin'
+                with open(os.path.join(tmp_dir, meta['preview']), 'wb') as f:
+                    f.write(preview)
+            meta['created_at'] = time.time()
+            meta['size'] = sum(os.path.getsize(os.path.join(tmp_dir, n)) for n in os.listdir(tmp_dir))
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+
+            with self._lock:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(tmp_dir, entry_dir)
+                self._entries[key] = meta
+                self._entries.move_to_end(key)
+        except Exception as e:
+            print(f"Cache: could not store {key[:12]}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries beyond max_entries / max_bytes"""
+        removed = []
+        with self._lock:
+            total = sum(m.get('size', 0) for m in self._entries.values())
+            while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+                key, meta = self._entries.popitem(last=False)
+                total -= meta.get('size', 0)
+                removed.append(key)
+        for key in removed:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        if removed:
+            print(f"Cache: evicted {len(removed)} entries")
+        return removed
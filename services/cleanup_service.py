@@ -47,12 +47,20 @@ def cleanup_old_files(folders, max_age_seconds=600):
             except Exception as e:
                 print(f"Cleanup error for {file_path}: {e}")
 
-def start_cleanup_worker(folders, interval=300, max_age=900):
-    """Start a background thread that periodically cleans up folders"""
+def start_cleanup_worker(folders, interval=300, max_age=900, tasks=()):
+    """Start a background thread that periodically cleans up folders.
+
+    Each callable in tasks (e.g. ResultCache.evict) runs after every pass.
+    """
     def worker():
         while True:
             print("Cleanup Worker: Running periodic cleanup...")
             cleanup_old_files(folders, max_age)
+            for task in tasks:
+                try:
+                    task()
+                except Exception as e:
+                    print(f"Cleanup task error: {e}")
             time.sleep(interval)
             
     thread = threading.Thread(target=worker, daemon=True)
@@ -0,0 +1,480 @@
+import sys
+import time
+import queue
+import functools
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utils.config_loader import config
+from services.stream_service import PreviewFrame
+
+# ProcessPoolExecutor(max_tasks_per_child=...) needs Python 3.11
+_NATIVE_RECYCLE = sys.version_info >= (3, 11)
+
+
+class FrameBroadcaster:
+    """Fans the preview frames of one job out to any number of viewers.
+
+    The producer publishes each frame once (a PreviewFrame, JPEG-encoded
+    per viewer setting on demand); subscribers only read the newest one,
+    so a slow viewer skips frames instead of holding back the job or the
+    other viewers, and a late joiner starts at the current frame.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._latest = None
+        self._closed = False
+        self._listeners = set()  # callables poked on every new frame / state change
+        self._viewer_widths = []  # largest preview width each current subscriber may ask for
+        self._on_viewers = None
+
+    @property
+    def subscribers(self):
+        return len(self._viewer_widths)
+
+    def publish(self, frame):
+        """Replace the latest frame and wake up subscribers"""
+        with self._cond:
+            self._latest = frame
+            self._seq += 1
+            self._cond.notify_all()
+        self.poke()
+
+    def close(self):
+        """End of stream: blocked subscribers return and see the final frame"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.poke()
+
+    def poke(self):
+        """Run the listener callbacks without publishing a frame (e.g. on progress)"""
+        with self._cond:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Broadcast listener error: {e}")
+
+    def add_listener(self, callback):
+        with self._cond:
+            self._listeners.add(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            self._listeners.discard(callback)
+
+    def latest(self):
+        """(seq, PreviewFrame) of the newest frame (None before the first), without waiting"""
+        with self._cond:
+            return self._seq, self._latest
+
+    def wait(self, last_seq, timeout=1.0):
+        """Block until a frame newer than last_seq exists (or the stream closes).
+
+        Returns (seq, PreviewFrame), like latest().
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq or self._closed, timeout)
+            return self._seq, self._latest
+
+    def viewer_width(self):
+        """Largest preview width a current subscriber may ask for; 0 when nobody watches"""
+        with self._cond:
+            return max(self._viewer_widths, default=0)
+
+    def watch_viewers(self, callback):
+        """Call callback(viewer_width()) now and whenever a viewer joins or leaves; None stops it"""
+        with self._cond:
+            self._on_viewers = callback
+            self._viewers_changed()
+
+    def _viewers_changed(self):
+        if self._on_viewers is not None:
+            self._on_viewers(max(self._viewer_widths, default=0))
+
+    @contextmanager
+    def subscription(self, width=None):
+        """Count a viewer of frames up to width px wide (default: the widest
+        stream.widths) for as long as the with-block runs"""
+        width = int(width or max(config.get('stream.widths', [960])))
+        with self._cond:
+            self._viewer_widths.append(width)
+            self._viewers_changed()
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self._viewer_widths.remove(width)
+                self._viewers_changed()
+
+
+class VideoJob:
+    """In-memory state of a single background video processing job.
+
+    The worker publishes annotated preview frames as PreviewFrames (through
+    ``broadcaster``; JPEG-encoded only when and as a viewer asks for them)
+    and progress here; the /stream and /status routes only read from it, so
+    a job runs once and keeps running whether or not anyone is watching.
+    """
+
+    def __init__(self, stream_id, filepath, model_choice, user_name, options=None):
+        self.stream_id = stream_id
+        self.filepath = filepath
+        self.model_choice = model_choice
+        self.user_name = user_name
+        self.options = dict(options or {})  # per-upload processing switches, e.g. {'motion_gate': True}
+        self.output_filename = f"result_{stream_id}.mp4"
+        self.cache_key = None   # ResultCache key the finished output is stored under
+        self.source = None      # UploadSession still receiving the file, if started early
+
+        self.status = 'queued'  # queued | processing | done | error
+        self.error = None
+        self.frames = 0         # frames processed so far
+        self.total_frames = 0   # frames reported by the container
+        self.detections = 0
+        self.class_counts = {}
+        self.inference_skipped = 0  # detector frames answered by the motion gate
+        self.processing_fps = 0.0
+        self.created_at = time.time()
+        self.finished_at = None
+
+        self._cond = threading.Condition()
+        self.broadcaster = FrameBroadcaster()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'error')
+
+    def publish_frame(self, preview):
+        """Hand the latest PreviewFrame to every /stream subscriber"""
+        self.broadcaster.publish(preview)
+
+    def add_listener(self, callback):
+        """Register callback() to run (on the worker thread) after each frame, progress update and at the end.
+
+        Lets non-blocking consumers such as asyncio streams wait without a
+        thread each; the callback must be cheap, e.g. loop.call_soon_threadsafe.
+        """
+        self.broadcaster.add_listener(callback)
+
+    def remove_listener(self, callback):
+        self.broadcaster.remove_listener(callback)
+
+    def _notify(self):
+        self.broadcaster.poke()
+
+    def latest_frame(self):
+        """(seq, PreviewFrame) of the newest preview frame, without waiting"""
+        return self.broadcaster.latest()
+
+    def update_progress(self, frames=None, total_frames=None, detections=None, class_counts=None, fps=None,
+                        skipped=None):
+        with self._cond:
+            if frames is not None:
+                self.frames = frames
+            if total_frames is not None:
+                self.total_frames = total_frames
+            if detections is not None:
+                self.detections = detections
+            if class_counts is not None:
+                self.class_counts = dict(class_counts)
+            if fps is not None:
+                self.processing_fps = fps
+            if skipped is not None:
+                self.inference_skipped = skipped
+        self._notify()
+
+    def finish(self, summary):
+        with self._cond:
+            self.detections = summary.get('detections', self.detections)
+            self.class_counts = dict(summary.get('class_counts', self.class_counts))
+            self.frames = summary.get('frames', self.frames)
+            self.inference_skipped = summary.get('inference_skipped') or self.inference_skipped
+            self.status = 'done'
+            self.finished_at = time.time()
+            self._cond.notify_all()
+        self.broadcaster.close()
+
+    def fail(self, error):
+        with self._cond:
+            self.error = str(error)
+            self.status = 'error'
+            self.finished_at = time.time()
+            self._cond.notify_all()
+        self.broadcaster.close()
+
+    def wait_for_frame(self, last_seq, timeout=1.0):
+        """Block until a frame newer than last_seq exists (or the job ends).
+
+        Returns (seq, PreviewFrame); seq == last_seq means nothing new arrived.
+        """
+        return self.broadcaster.wait(last_seq, timeout)
+
+    def to_status(self):
+        with self._cond:
+            progress = 0.0
+            if self.status == 'done':
+                progress = 1.0
+            elif self.total_frames > 0:
+                progress = min(1.0, self.frames / self.total_frames)
+            return {
+                'ready': self.status == 'done',
+                'filename': self.output_filename,
+                'detections': self.detections,
+                'class_counts': dict(self.class_counts),
+                'frames': self.frames,
+                'total_frames': self.total_frames,
+                'inference_skipped': self.inference_skipped,
+                'progress': round(progress, 4),
+                'processing_fps': round(self.processing_fps, 1),
+                'status': self.status,
+                'error': self.error,
+                'viewers': self.broadcaster.subscribers
+            }
+
+
+class JobManager:
+    """Queue of video jobs executed by a fixed set of worker threads"""
+
+    def __init__(self, worker_fn, num_workers=2, on_complete=None, retention_seconds=900):
+        self.worker_fn = worker_fn
+        self.on_complete = on_complete
+        self.retention_seconds = retention_seconds
+        self.jobs = {}  # {stream_id: VideoJob}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        for i in range(max(1, int(num_workers))):
+            t = threading.Thread(target=self._worker, name=f"video-job-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def submit(self, job):
+        """Queue job, unless one for the same stream_id is already queued/running.
+
+        Returns the job that will produce the stream; callers must use it
+        instead of their own so a stream is never processed (and recorded)
+        twice.
+        """
+        self._prune()
+        with self._lock:
+            existing = self.jobs.get(job.stream_id)
+            if existing is not None and not existing.finished:
+                print(f"Job {job.stream_id} already {existing.status}, reusing it")
+                return existing
+            self.jobs[job.stream_id] = job
+        self._queue.put(job)
+        print(f"Job queued: {job.stream_id} (pending: {self._queue.qsize()})")
+        return job
+
+    def add_finished(self, job, summary):
+        """Register a job whose output already exists (e.g. served from cache)"""
+        self._prune()
+        with self._lock:
+            self.jobs[job.stream_id] = job
+        job.finish(summary)
+        return job
+
+    def get(self, stream_id):
+        with self._lock:
+            return self.jobs.get(stream_id)
+
+    def _prune(self):
+        """Forget finished jobs whose outputs the cleanup worker has expired"""
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, job in self.jobs.items()
+                       if job.finished and job.finished_at and now - job.finished_at > self.retention_seconds]
+            for sid in expired:
+                del self.jobs[sid]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.status = 'processing'
+            try:
+                summary = self.worker_fn(job) or {}
+            except Exception as e:
+                print(f"Job {job.stream_id} failed: {e}")
+                job.fail(e)
+                self._queue.task_done()
+                continue
+
+            # Record results before flagging ready so pollers see final stats
+            try:
+                if self.on_complete is not None:
+                    self.on_complete(job, summary)
+            except Exception as e:
+                print(f"Job {job.stream_id} completion hook error: {e}")
+            job.finish(summary)
+            self._queue.task_done()
+
+
+# Set in each pool worker process by _init_worker_process
+_worker_events = None
+_worker_viewers = None
+
+
+def _init_worker_process(events, viewers):
+    global _worker_events, _worker_viewers
+    _worker_events = events
+    _worker_viewers = viewers
+    # Pools and the scheduler are per process; a worker runs one job at a
+    # time, so one model instance each and no dispatcher threads
+    from utils.model import set_pool_size
+    from utils.inference_scheduler import disable_scheduler
+    set_pool_size(1)
+    disable_scheduler()
+
+
+class _WorkerJob(VideoJob):
+    """VideoJob stand-in inside a worker process; forwards updates to the parent.
+
+    Preview frames are only JPEG-encoded and shipped while the parent
+    reports a viewer in ``_worker_viewers[slot]`` (the largest width one may
+    ask for, 0 when nobody watches); the last frame is always sent at the
+    end, for late joiners and the result cache.
+    """
+
+    def __init__(self, *args, slot=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slot = slot
+        self._unsent = None
+
+    def _send(self, preview, width):
+        # Ship a JPEG no wider than the viewers ask for, not raw pixels
+        width = min(preview.width, width)
+        quality = config.get('processing.jpeg_quality', 80)
+        _worker_events.put((self.stream_id, 'frame', (preview.jpeg(width, quality), quality, width)))
+
+    def publish_frame(self, preview):
+        width = max(config.get('stream.widths', [960])) if self.slot is None else _worker_viewers[self.slot]
+        if width <= 0:
+            self._unsent = preview  # nobody watching: skip the imencode
+            return
+        self._unsent = None
+        self._send(preview, width)
+
+    def flush(self):
+        """Send the newest frame if it was skipped for lack of viewers"""
+        if self._unsent is not None:
+            self._send(self._unsent, max(config.get('stream.widths', [960])))
+            self._unsent = None
+
+    def update_progress(self, **kwargs):
+        _worker_events.put((self.stream_id, 'progress', kwargs))
+
+
+def _run_job_in_worker(target, stream_id, filepath, model_choice, user_name, options, slot):
+    job = _WorkerJob(stream_id, filepath, model_choice, user_name, options, slot=slot)
+    try:
+        return target(job)
+    finally:
+        job.flush()
+        _worker_events.put((stream_id, 'end', None))
+
+
+class ProcessJobRunner:
+    """worker_fn for JobManager that runs each job in a separate process.
+
+    ``target(job)`` (a picklable module-level function or partial, e.g.
+    run_video_job) executes in a spawned worker with its own loaded model
+    (a single instance, without the inference scheduler), so several
+    videos scale across cores instead of sharing one GIL.
+    Preview frames and progress come back over a queue and are relayed to
+    the real VideoJob; the summary is returned to JobManager in this
+    process, which keeps GlobalTracker updates in the parent. Each running
+    job owns a slot of a shared array holding its viewer_width(), so a
+    worker skips preview encoding while nobody watches. Workers are
+    replaced after max_tasks_per_child jobs to bound memory growth (before
+    Python 3.11, by moving to a fresh pool after max_workers times that
+    many jobs; the old pool finishes its running jobs and exits).
+    """
+
+    def __init__(self, target, max_workers=2, max_tasks_per_child=None):
+        self.target = target
+        self.max_workers = max(1, int(max_workers))
+        self.max_tasks_per_child = int(max_tasks_per_child) if max_tasks_per_child else None
+        self._ctx = multiprocessing.get_context('spawn')
+        self._events = self._ctx.Queue()
+        self._viewers = self._ctx.RawArray('i', self.max_workers)  # per slot, see _WorkerJob
+        self._free_slots = list(range(self.max_workers))
+        self._active = {}  # {stream_id: (VideoJob, relayed-all Event)} currently running in a worker
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+        threading.Thread(target=self._relay, name="job-events", daemon=True).start()
+
+    def _new_executor(self):
+        kwargs = {}
+        if self.max_tasks_per_child and _NATIVE_RECYCLE:
+            kwargs['max_tasks_per_child'] = self.max_tasks_per_child
+        self._submitted = 0  # jobs sent to this pool
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._ctx,
+            initializer=_init_worker_process,
+            initargs=(self._events, self._viewers),
+            **kwargs
+        )
+
+    def _recycle_due(self):
+        return (self.max_tasks_per_child is not None and not _NATIVE_RECYCLE
+                and self._submitted >= self.max_workers * self.max_tasks_per_child)
+
+    def _relay(self):
+        while True:
+            stream_id, kind, payload = self._events.get()
+            with self._lock:
+                job, done = self._active.get(stream_id, (None, None))
+            if job is None:
+                continue  # late event of a job that already returned
+            if kind == 'end':
+                done.set()
+            elif kind == 'frame':
+                jpeg, quality, width = payload
+                job.publish_frame(PreviewFrame.from_jpeg(jpeg, quality, width))
+            elif kind == 'progress':
+                job.update_progress(**payload)
+
+    def __call__(self, job):
+        done = threading.Event()
+        with self._lock:
+            self._active[job.stream_id] = (job, done)
+            slot = self._free_slots.pop() if self._free_slots else None
+            if self._recycle_due():
+                old, self._executor = self._executor, self._new_executor()
+                old.shutdown(wait=False)
+            self._submitted += 1
+            executor = self._executor
+        if slot is not None:
+            job.broadcaster.watch_viewers(functools.partial(self._viewers.__setitem__, slot))
+        relayed = True  # the worker sends 'end' after its last event unless it dies
+        try:
+            future = executor.submit(_run_job_in_worker, self.target, job.stream_id,
+                                     job.filepath, job.model_choice, job.user_name, job.options, slot)
+            return future.result()
+        except BrokenProcessPool:
+            relayed = False
+            # A worker died (e.g. out of memory); start a fresh pool for later jobs
+            with self._lock:
+                if self._executor is executor:
+                    print("Job process pool broken, restarting workers")
+                    self._executor = self._new_executor()
+            raise
+        finally:
+            if relayed:
+                # Let the final frame reach the job before JobManager caches its preview
+                done.wait(timeout=5)
+            if slot is not None:
+                job.broadcaster.watch_viewers(None)
+            with self._lock:
+                self._active.pop(job.stream_id, None)
+                if slot is not None:
+                    self._viewers[slot] = 0
+                    self._free_slots.append(slot)
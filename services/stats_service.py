@@ -1,15 +1,22 @@
 import os
 import json
 
+# Former Windows-only default; still read when the new path has no file yet
+LEGACY_STATS_PATH = r"data\global_stats.json"
+
+
 class GlobalTracker:
-    def __init__(self, stats_path=r"data\global_stats.json"):
+    def __init__(self, stats_path=os.path.join("data", "global_stats.json")):
         self.stats_path = stats_path
         self.data = self._load()
 
     def _load(self):
-        if os.path.exists(self.stats_path):
+        path = self.stats_path
+        if not os.path.exists(path) and os.path.exists(LEGACY_STATS_PATH):
+            path = LEGACY_STATS_PATH
+        if os.path.exists(path):
             try:
-                with open(self.stats_path, 'r') as f:
+                with open(path, 'r') as f:
                     data = json.load(f)
                     # Migrasi jika data lama tidak punya category_stats
                     if "category_stats" not in data:
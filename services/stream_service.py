@@ -0,0 +1,150 @@
+import time
+import threading
+import cv2
+import numpy as np
+from utils.config_loader import config
+
+
+def _mjpeg_chunk(jpeg_bytes):
+    """Wrap an encoded JPEG as one part of a multipart/x-mixed-replace stream"""
+    boundary = b'--frame\r\n'
+    header = b'Content-Type: image/jpeg\r\nContent-Length: ' + str(len(jpeg_bytes)).encode() + b'\r\n\r\n'
+    footer = b'\r\n'
+    return boundary + header + jpeg_bytes + footer
+
+
+class PreviewFrame:
+    """One published preview frame, JPEG-encoded on demand.
+
+    Encodings are cached per (width, quality), so viewers on the same
+    setting share one cv2.imencode and frames nobody watches are never
+    encoded. Built either from the annotated image (which must not be
+    modified afterwards) or from JPEG bytes, e.g. relayed from a worker
+    process or restored from the result cache.
+    """
+
+    def __init__(self, image=None, jpeg=None, quality=None, width=None):
+        self._image = image
+        self._jpeg = jpeg
+        self._jpeg_quality = quality
+        self.width = image.shape[1] if image is not None else width
+        self._chunks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_jpeg(cls, data, quality=None, width=None):
+        # Tolerate MJPEG parts (headers before the JPEG start marker)
+        start = data.find(b'\xff\xd8')
+        return cls(jpeg=data[start:] if start > 0 else data, quality=quality, width=width)
+
+    def _decoded(self):
+        if self._image is None:
+            self._image = cv2.imdecode(np.frombuffer(self._jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self.width = self._image.shape[1]
+        return self._image
+
+    def _encode(self, width, quality):
+        if (self._jpeg is not None and quality == self._jpeg_quality
+                and self.width is not None and width >= self.width):
+            return self._jpeg
+        image = self._decoded()
+        h, w = image.shape[:2]
+        if width < w:
+            image = cv2.resize(image, (width, max(1, int(h * width / w))), interpolation=cv2.INTER_AREA)
+        success, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        return bytes(buffer) if success else None
+
+    def jpeg(self, width=None, quality=None):
+        """JPEG bytes at most width wide, at quality (default processing.jpeg_quality)"""
+        if quality is None:
+            quality = self._jpeg_quality or config.get('processing.jpeg_quality', 80)
+        with self._lock:
+            return self._encode(width or self.width or self._decoded().shape[1], quality)
+
+    def chunk(self, width, quality):
+        """MJPEG part for a viewer asking for (width, quality)"""
+        with self._lock:
+            if self.width is not None:
+                width = min(width, self.width)
+            key = (width, quality)
+            chunk = self._chunks.get(key)
+            if chunk is None:
+                data = self._encode(width, quality)
+                chunk = self._chunks[key] = _mjpeg_chunk(data) if data else b''
+            return chunk
+
+
+class AdaptiveStream:
+    """Per-viewer MJPEG rate control.
+
+    Aims at stream.target_kbps (or the viewer's measured throughput, if
+    lower): JPEG quality is stepped between stream.min_quality and
+    processing.jpeg_quality first, then the preview width moves along the
+    stream.widths ladder, and only at the smallest size is the frame rate
+    lowered towards stream.min_fps. Sends are paced to at most
+    stream.max_fps (> 0); frames published in between are skipped, since
+    the broadcaster only keeps the latest one. With stream.adaptive off the
+    largest width, processing.jpeg_quality and max_fps are used as-is. The
+    saved MP4 is unaffected.
+    """
+
+    QUALITY_STEP = 5
+
+    def __init__(self, target_kbps=None, max_width=None):
+        self.adaptive = config.get('stream.adaptive', True)
+        self.target_rate = (target_kbps or config.get('stream.target_kbps', 1500)) * 1000 / 8  # bytes/s
+        widths = sorted(config.get('stream.widths', [960, 640, 480, 320]), reverse=True)
+        if max_width:
+            widths = [w for w in widths if w <= max_width] or [max_width]
+        self.widths = widths
+        self.max_quality = config.get('processing.jpeg_quality', 80)
+        self.min_quality = min(self.max_quality, config.get('stream.min_quality', 35))
+        self.max_fps = max(1, config.get('stream.max_fps', 15))
+        self.min_fps = min(self.max_fps, max(0.1, config.get('stream.min_fps', 2)))
+
+        self.level = 0  # index into widths
+        self.quality = self.max_quality
+        self.fps = self.max_fps
+        self.throughput = None  # bytes/s the viewer has been able to take
+        self.last_sent = 0.0
+
+    @property
+    def width(self):
+        return self.widths[self.level]
+
+    def encode(self, preview):
+        return preview.chunk(self.width, self.quality)
+
+    def delay(self):
+        """Seconds to wait before the next frame is due"""
+        return max(0.0, self.last_sent + 1.0 / self.fps - time.perf_counter())
+
+    def sent(self, nbytes, seconds):
+        """Record a frame of nbytes that took seconds to hand to the client"""
+        self.last_sent = time.perf_counter()
+        if not self.adaptive or nbytes <= 0:
+            return
+        sample = nbytes / max(seconds, 1e-3)
+        self.throughput = sample if self.throughput is None else 0.7 * self.throughput + 0.3 * sample
+
+        rate = self.target_rate
+        if self.throughput < rate:
+            rate = 0.9 * self.throughput  # client is the bottleneck
+        budget = rate / self.fps
+
+        if nbytes > 1.15 * budget:
+            if self.quality - self.QUALITY_STEP >= self.min_quality:
+                self.quality -= self.QUALITY_STEP
+            elif self.level < len(self.widths) - 1:
+                self.level += 1
+                self.quality = self.max_quality
+            else:
+                self.fps = max(self.min_fps, min(self.fps, rate / nbytes))
+        elif nbytes < 0.7 * budget:
+            if self.fps < self.max_fps:
+                self.fps = min(self.max_fps, self.fps * 1.25)
+            elif self.quality + self.QUALITY_STEP <= self.max_quality:
+                self.quality += self.QUALITY_STEP
+            elif self.level > 0:
+                self.level -= 1
+                self.quality = self.min_quality
@@ -0,0 +1,180 @@
+import os
+import time
+import hashlib
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_stream(stream, dest_path, hasher=None, chunk_size=CHUNK_SIZE, mode='wb', limit=None):
+    """Copy a readable stream to dest_path chunk by chunk, hashing on the way.
+
+    Returns the number of bytes written. Raises ValueError once more than
+    limit bytes arrive.
+    """
+    written = 0
+    with open(dest_path, mode) as f:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            written += len(chunk)
+            if limit is not None and written > limit:
+                raise ValueError("Upload exceeds the maximum size")
+            f.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+    return written
+
+
+class UploadSession:
+    """A resumable chunked upload written straight to disk.
+
+    Chunks must arrive in order (``offset`` equal to the bytes received so
+    far); the SHA-256 is updated incrementally, so completing the upload
+    needs no second pass over the file. Readers can follow the file while
+    it grows with iter_bytes(), which lets a video job decode the first
+    frames before the last chunk has arrived.
+    """
+
+    def __init__(self, upload_id, filename, filepath, model_choice, user_name, size=None, options=None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.filepath = filepath
+        self.model_choice = model_choice
+        self.user_name = user_name
+        self.options = dict(options or {})
+        self.size = size
+        self.received = 0
+        self.complete = False
+        self.aborted = False
+        self.job = None  # video job started before the upload finished
+        self.probed = False  # early-start header check already attempted
+        self.stalled = False  # an iter_bytes() reader gave up waiting for data
+        self.updated_at = time.time()
+        self._hasher = hashlib.sha256()
+        self._cond = threading.Condition()
+        open(filepath, 'wb').close()
+
+    @property
+    def finished(self):
+        return self.complete or self.aborted
+
+    def append(self, stream, offset, limit=None):
+        """Write one chunk at offset; returns the new received byte count"""
+        with self._cond:
+            if self.finished:
+                raise ValueError("Upload is already closed")
+            if offset != self.received:
+                raise OffsetMismatch(self.received)
+            remaining = None if limit is None else limit - self.received
+            try:
+                written = save_stream(stream, self.filepath, self._hasher, mode='ab', limit=remaining)
+            except Exception:
+                # Drop a partially written chunk so the client can resend it
+                with open(self.filepath, 'ab') as f:
+                    f.truncate(self.received)
+                self._hasher = None
+                raise
+            self.received += written
+            self.updated_at = time.time()
+            self._cond.notify_all()
+            return self.received
+
+    def digest(self):
+        """SHA-256 of all bytes received; raises if the declared size is not reached"""
+        with self._cond:
+            if self.size is not None and self.received != self.size:
+                raise ValueError(f"Upload incomplete: {self.received} of {self.size} bytes")
+            if self._hasher is None:
+                # A failed chunk invalidated the running hash; rehash from disk
+                from services.cache_service import file_sha256
+                return file_sha256(self.filepath)
+            return self._hasher.hexdigest()
+
+    def finish(self):
+        """Mark the upload complete; followers of iter_bytes() drain and stop"""
+        with self._cond:
+            self.complete = True
+            self._cond.notify_all()
+
+    def abort(self):
+        with self._cond:
+            if not self.complete:
+                self.aborted = True
+            self._cond.notify_all()
+
+    def iter_bytes(self, chunk_size=CHUNK_SIZE, stall_timeout=300, stop=None):
+        """Yield the file's committed bytes as they land, until the upload completes.
+
+        Stops early if the upload is aborted, no data arrives for
+        stall_timeout seconds, or the reader sets the stop event (checked
+        at least twice a second while waiting).
+        """
+        position = 0
+        with open(self.filepath, 'rb') as f:
+            while True:
+                with self._cond:
+                    deadline = time.time() + stall_timeout
+                    arrived = self.received > position or self.finished
+                    while not arrived and time.time() < deadline:
+                        if stop is not None and stop.is_set():
+                            return
+                        arrived = self._cond.wait_for(lambda: self.received > position or self.finished,
+                                                      min(0.5, max(0.0, deadline - time.time())))
+                    if self.aborted or (stop is not None and stop.is_set()):
+                        return
+                    available = self.received - position
+                    if available <= 0:
+                        if not self.complete and not arrived:
+                            print(f"Upload {self.upload_id} stalled, stopping reader")
+                            self.stalled = True
+                        return
+                data = f.read(min(chunk_size, available))
+                if not data:
+                    return
+                position += len(data)
+                yield data
+
+
+class OffsetMismatch(ValueError):
+    """A chunk was sent for the wrong offset; carries the expected one"""
+
+    def __init__(self, expected):
+        super().__init__(f"Expected offset {expected}")
+        self.expected = expected
+
+
+class UploadManager:
+    """In-memory registry of chunked uploads (resumable while the server runs)"""
+
+    def __init__(self, upload_folder, max_bytes=None, idle_seconds=900):
+        self.upload_folder = upload_folder
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, upload_id, filename, model_choice, user_name, size=None, options=None):
+        if size is not None and self.max_bytes is not None and size > self.max_bytes:
+            raise ValueError("Upload exceeds the maximum size")
+        self.prune()
+        filepath = os.path.join(self.upload_folder, filename)
+        session = UploadSession(upload_id, filename, filepath, model_choice, user_name, size=size, options=options)
+        with self._lock:
+            self.sessions[upload_id] = session
+        return session
+
+    def get(self, upload_id):
+        with self._lock:
+            return self.sessions.get(upload_id)
+
+    def remove(self, upload_id):
+        with self._lock:
+            return self.sessions.pop(upload_id, None)
+
+    def prune(self):
+        """Abort and forget uploads that have been idle too long"""
+        now = time.time()
+        with self._lock:
+            stale = [uid for uid, s in self.sessions.items() if now - s.updated_at > self.idle_seconds]
+            removed = [self.sessions.pop(uid) for uid in stale]
+        for session in removed:
+            session.abort()
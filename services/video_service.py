@@ -1,258 +1,653 @@
 import cv2
 import os
 import time
-import numpy as np
+import asyncio
 import json
+import shutil
+import threading
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from utils.config_loader import config
-from utils.model import get_model, infer_frame
-from utils.tracking import CentroidTracker
+from utils.model import get_model, infer_batch
+from utils.inference_scheduler import inference_model
+from utils.tracking import create_tracker, stitch_track_ids
+from utils.pipeline import Pipeline
+from utils.detections import extract_detections, empty_detections
+from utils.video_io import open_capture, open_writer
+from utils.annotation import get_renderer
+from utils.motion import create_motion_gate
+from utils.tiling import infer_tiled, scale_detections
+from services.stream_service import PreviewFrame, AdaptiveStream
 from services.cleanup_service import delete_file
 
-def generate_frames(filepath, model_choice, user_name, stream_id, config, global_stats, active_stats):
-    try:
-        model = get_model(model_choice)
-        
-        cap = cv2.VideoCapture(filepath)
-        prev_time = time.time()
-
-        # Prepare output writer to save processed video concurrently
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        output_filename = f"result_{stream_id}.mp4"
-        output_path = os.path.join(config['OUTPUT_FOLDER'], output_filename)
-        
-        print(f"Starting stream: {stream_id}, model: {model_choice}")
-        print(f"Video dims: {width}x{height}, fps: {fps}")
-        
+# Track IDs of segment i start at i * SEGMENT_ID_BLOCK so they never collide
+SEGMENT_ID_BLOCK = 1000000
+
+
+def _error_frame(message):
+    err_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(err_frame, message, (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    return PreviewFrame(err_frame)
+
+
+def generate_frames(job, target_kbps=None, max_width=None):
+    """MJPEG generator subscribed to the job's frame broadcaster.
+
+    Every viewer of a stream shares the one running job: a late joiner
+    starts at the current frame, and disconnecting only stops this
+    generator while the job itself keeps running. Size, quality and frame
+    rate adapt to this viewer (see AdaptiveStream); the time the server
+    takes to accept each part is the throughput estimate.
+    """
+    rate = AdaptiveStream(target_kbps, max_width)
+    with job.broadcaster.subscription(rate.width) as frames:
+        last_seq = 0
+        while True:
+            time.sleep(rate.delay())
+            seq, preview = frames.wait(last_seq, timeout=1.0)
+            if seq != last_seq and preview is not None:
+                last_seq = seq
+                chunk = rate.encode(preview)
+                started = time.perf_counter()
+                yield chunk
+                rate.sent(len(chunk), time.perf_counter() - started)
+            elif job.finished:
+                break
+
+
+async def generate_frames_async(job, target_kbps=None, max_width=None, idle_timeout=1.0):
+    """asyncio twin of generate_frames for the ASGI server.
+
+    Waits on an asyncio.Event poked by the broadcaster's listener hook
+    instead of blocking a thread per viewer, so one event loop can serve
+    many streams. JPEG encoding runs in the default executor.
+    """
+    loop = asyncio.get_running_loop()
+    new_frame = asyncio.Event()
+    rate = AdaptiveStream(target_kbps, max_width)
+
+    def poke():
+        loop.call_soon_threadsafe(new_frame.set)
+
+    with job.broadcaster.subscription(rate.width) as frames:
+        frames.add_listener(poke)
         try:
-            # We will resize frames to target width, so we need to update writer dims
-            target_width = config.get('processing.video_target_width', 640)
-            if width > target_width:
-                scale_init = target_width / width
-                target_height = int(height * scale_init)
-            else:
-                target_width = width
-                target_height = height
-            
-            print(f"Output Video dims: {target_width}x{target_height}, fps: {fps}")
-            out_writer = cv2.VideoWriter(output_path, fourcc, fps, (target_width, target_height))
-        except Exception as e:
-            print(f"VideoWriter init error: {e}")
-            out_writer = None
-
-        # Track detections and class counts during streaming with centroid tracking
-        # Adaptive tracking parameters based on video resolution
-        adaptive_max_distance = max(50, int(width * 0.05))  # 5% of width
-        adaptive_max_disappeared = max(40, int(fps * 1.5))  # 1.5 seconds worth of frames
-        print(f"Tracking params: max_distance={adaptive_max_distance}, max_disappeared={adaptive_max_disappeared}")
-        ct = CentroidTracker(max_disappeared=adaptive_max_disappeared, max_distance=adaptive_max_distance)
-        unique_objects = {}  # {class_name: set of objectIDs}
-        class_counts = {}    # {class_name: count of unique objects}
-        frame_count = 0      # Track total frames for duration calculation
-
-
-        # Verify capture
-        if not cap.isOpened():
-            print(f"Error: Could not open video file: {filepath}")
-            # Create error frame
-            err_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(err_frame, "Error: Cannot Open Video", (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-            success, buffer = cv2.imencode('.jpg', err_frame)
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            return
+            last_seq = 0
+            while True:
+                await asyncio.sleep(rate.delay())
+                new_frame.clear()
+                seq, preview = frames.latest()
+                if seq != last_seq and preview is not None:
+                    last_seq = seq
+                    chunk = await loop.run_in_executor(None, rate.encode, preview)
+                    started = time.perf_counter()
+                    yield chunk
+                    rate.sent(len(chunk), time.perf_counter() - started)
+                    continue
+                if job.finished:
+                    break
+                try:
+                    await asyncio.wait_for(new_frame.wait(), idle_timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            frames.remove_listener(poke)
+
+
+def _sse(payload):
+    """Encode one Server-Sent Events message"""
+    return f"data: {json.dumps(payload)}\n\n"
+
 
-        print(f"Capture opened successfully. Frame count: {int(cap.get(cv2.CAP_PROP_FRAME_COUNT))}")
+def generate_events(job, min_interval=0.2, keepalive=15.0):
+    """SSE generator pushing job.to_status() whenever it changes.
 
+    Wakes on new frames/progress (at most every min_interval seconds),
+    sends a comment line as keep-alive and ends after the final status.
+    """
+    last_seq, last_payload = -1, None
+    last_sent = time.time()
+    while True:
+        last_seq, _ = job.wait_for_frame(last_seq, timeout=1.0)
+        payload = job.to_status()
+        if payload != last_payload:
+            last_payload = payload
+            last_sent = time.time()
+            yield _sse(payload)
+        elif time.time() - last_sent > keepalive:
+            last_sent = time.time()
+            yield ": keep-alive\n\n"
+        if job.finished:
+            break
+        time.sleep(min_interval)
+
+
+async def generate_events_async(job, min_interval=0.2, keepalive=15.0):
+    """asyncio twin of generate_events, woken by the job's listener hook"""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def poke():
+        loop.call_soon_threadsafe(changed.set)
+
+    job.add_listener(poke)
+    try:
+        last_payload = None
+        last_sent = time.time()
         while True:
-            ret, frame = cap.read()
-            if not ret:
-                print(f"End of stream or read error at frame {frame_count}")
+            changed.clear()
+            payload = job.to_status()
+            if payload != last_payload:
+                last_payload = payload
+                last_sent = time.time()
+                yield _sse(payload)
+            elif time.time() - last_sent > keepalive:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            if job.finished:
                 break
-            
-            frame_count += 1
-            
-            # Validate frame
-            if frame is None or frame.size == 0:
-                print("Warning: Empty frame received")
-                continue
-            
-            # 1. Prepare Frame for Inference and Annotation
-            raw_frame = frame.copy()
-            h_orig, w_orig = frame.shape[:2]
-            
-            # Resize for Inference speed
-            max_w_v8 = config.get('processing.max_width_v8', 1024)
-            max_w_rtdetr = config.get('processing.max_width_rtdetr', 800)
-            target_max_width = max_w_rtdetr if 'rtdetr' in str(model_choice).lower() else max_w_v8
-            scale_inference = 1.0
-            if w_orig > target_max_width:
-                scale_inference = target_max_width / w_orig
-                new_h = int(h_orig * scale_inference)
-                inf_frame = cv2.resize(frame, (target_max_width, new_h))
-            else:
-                inf_frame = frame.copy()
-                scale_inference = 1.0
-            
-            # ensure 3 channels
-            if len(inf_frame.shape) != 3:
-                 inf_frame = cv2.cvtColor(inf_frame, cv2.COLOR_GRAY2BGR)
+            await asyncio.sleep(min_interval)
+            if not changed.is_set():
+                try:
+                    await asyncio.wait_for(changed.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        job.remove_listener(poke)
+
+
+def _resize_once(frame, inf_width, output_size, detect=True, output=True):
+    """Derive the inference and output images of a decoded frame.
+
+    Returns (inf_frame, inf_scale, out_frame). Each is made with at most
+    one resize, the output image from the already smaller inference image
+    when it is large enough, and either one is the decoded frame itself
+    when no resize is needed, so nothing is copied. The output image is
+    annotated in place, after inference on the same batch has finished.
+    """
+    h, w = frame.shape[:2]
+    inf_frame, inf_scale, out_frame = None, 1.0, None
+    if detect:
+        if w > inf_width:
+            inf_scale = inf_width / w
+            inf_frame = cv2.resize(frame, (inf_width, int(h * inf_scale)))
+        else:
+            inf_frame = frame
+        # ensure 3 channels
+        if len(inf_frame.shape) != 3:
+            inf_frame = cv2.cvtColor(inf_frame, cv2.COLOR_GRAY2BGR)
+    if output:
+        out_w, out_h = output_size
+        source = inf_frame if inf_frame is not None and inf_frame.shape[1] >= out_w else frame
+        if source.shape[1] == out_w and source.shape[0] == out_h:
+            out_frame = source
+        else:
+            out_frame = cv2.resize(source, (out_w, out_h), interpolation=cv2.INTER_AREA)
+    return inf_frame, inf_scale, out_frame
+
+
+def _decode_batches(cap, batch_size, target_max_width, output_size, detection_stride=1,
+                    start_index=0, end_index=None, output_from=0, motion_gate=None):
+    """Read frames from cap and yield lists of frame items.
+
+    Each item is a dict with its 1-based ``index``, a ``detect`` flag, the
+    ``frame`` already scaled to output_size and ``out_scale`` (output /
+    source width). Only detector frames (every detection_stride-th) get an
+    ``inf_frame`` and its ``scale``; frames up to output_from (warm-up) get
+    no output frame. A batch closes once it holds batch_size detector
+    frames. start_index is the number of frames already skipped (cap must
+    be positioned there); reading stops at end_index.
+
+    With a motion_gate, detector frames it finds static are marked
+    ``reuse`` instead: they get no inference image and take over the
+    previous detections. They do not count towards batch_size, but a batch
+    never grows beyond batch_size * detection_stride frames.
+    """
+    frame_index = start_index
+    batch = []
+    detect_count = 0
+    scratch = None  # decode buffer to refill, once a frame was only a resize source
+    while end_index is None or frame_index < end_index:
+        ret, frame = cap.read(scratch) if scratch is not None else cap.read()
+        if not ret:
+            print(f"End of stream or read error at frame {frame_index}")
+            break
+        frame_index += 1
+
+        # Validate frame
+        if frame is None or frame.size == 0:
+            print("Warning: Empty frame received")
+            continue
+
+        detect = (frame_index - 1) % detection_stride == 0
+        output = frame_index > output_from
+        if not detect and not output:
+            scratch = frame
+            continue  # warm-up frame between detections: nothing to track or draw
+        reuse = False
+        if detect and motion_gate is not None:
+            # Gate on the (cheap) output image; resize for inference only if the scene moved
+            _, _, out_frame = _resize_once(frame, target_max_width, output_size, False, output)
+            reuse = not motion_gate.changed(out_frame if out_frame is not None else frame)
+            inf_frame, scale = None, 1.0
+            if not reuse:
+                inf_frame, scale, _ = _resize_once(frame, target_max_width, output_size, True, False)
+        else:
+            inf_frame, scale, out_frame = _resize_once(frame, target_max_width, output_size, detect, output)
+        # Neither image is the decoded frame itself: its buffer can be reused
+        scratch = frame if inf_frame is not frame and out_frame is not frame else None
+        item = {'index': frame_index, 'detect': detect, 'frame': out_frame,
+                'out_scale': output_size[0] / frame.shape[1]}
+        if reuse:
+            item['reuse'] = True
+        elif detect:
+            item['inf_frame'] = inf_frame
+            item['scale'] = scale
+            detect_count += 1
+
+        batch.append(item)
+        if detect_count >= batch_size or len(batch) >= batch_size * detection_stride:
+            yield batch
+            batch = []
+            detect_count = 0
+    if batch:
+        yield batch
+
+
+def _output_size(width, height):
+    """Output video dims: frames are downscaled to processing.video_target_width"""
+    target_width = config.get('processing.video_target_width', 640)
+    if width > target_width:
+        scale_init = target_width / width
+        return target_width, int(height * scale_init)
+    return width, height
+
 
+def _open_writer(output_path, fps, size):
+    """Output MP4 writer; H.264 on a background thread unless processing.video_encoder is 'mp4v'"""
+    try:
+        return open_writer(output_path, fps, size)
+    except Exception as e:
+        print(f"VideoWriter init error: {e}")
+        return None
+
+
+def _annotate_range(job, output_path, start=0, end=None, warmup=0, tail=0, id_base=0,
+                    should_publish=None, on_progress=None):
+    """Detect, track and annotate frames start..end of job.filepath into output_path.
+
+    The ``warmup`` frames before start are detected and tracked but neither
+    written nor counted, so the tracker enters the range already settled.
+    Tracks visible on those frames are returned as ``head``, and the ones
+    visible on the last ``tail`` frames as ``tail`` (see stitch_track_ids).
+    New track IDs start at id_base. should_publish() gates preview frames,
+    on_progress(frames, class_counts, fps, skipped) is called every 10
+    frames, skipped being the detector frames the motion gate (enabled per
+    upload with job.options['motion_gate']) answered from the previous
+    detections.
+    """
+    model_choice = job.model_choice
+    model = get_model(model_choice)
+    max_w_v8 = config.get('processing.max_width_v8', 1024)
+    max_w_rtdetr = config.get('processing.max_width_rtdetr', 800)
+    target_max_width = max_w_rtdetr if 'rtdetr' in str(model_choice).lower() else max_w_v8
+    # Tiled mode (per upload): slice a larger frame into model-sized tiles
+    # instead of shrinking it, so small debris keeps its pixels
+    tiled = bool(job.options.get('tiled'))
+    if tiled:
+        target_max_width = config.get('processing.tile_max_width', 1920)
+
+    # FFmpeg-based backends decode straight to the largest size any stage
+    # uses; frame coordinates below are in that (decoded) resolution
+    decode_width = max(target_max_width, config.get('processing.video_target_width', 640))
+    cap = open_capture(job.filepath, job.source, max_width=decode_width)
+    if not cap.isOpened():
+        print(f"Error: Could not open video file: {job.filepath}")
+        job.publish_frame(_error_frame("Error: Cannot Open Video"))
+        raise IOError(f"Could not open video file: {job.filepath}")
+
+    fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    first = max(0, start - warmup)
+    if first > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    # Prepare output writer to save processed video concurrently
+    target_width, target_height = _output_size(width, height)
+    out_writer = _open_writer(output_path, fps, (target_width, target_height))
+
+    # Track detections and class counts during streaming with object tracking
+    # Adaptive tracking parameters based on video resolution
+    adaptive_max_distance = max(50, int(width * 0.05))  # 5% of width
+    adaptive_max_disappeared = max(40, int(fps * 1.5))  # 1.5 seconds worth of frames
+    # Detection stride: run the detector on every k-th frame only; frames
+    # in between reuse boxes propagated by the tracker
+    detection_stride = max(1, int(config.get('processing.detection_stride', 1)))
+    tracker_engine = config.get('processing.tracker', 'centroid')
+    print(f"Tracking params: engine={tracker_engine}, max_distance={adaptive_max_distance}, "
+          f"max_disappeared={adaptive_max_disappeared}, detection_stride={detection_stride}")
+    ct = create_tracker(tracker_engine, max_disappeared=adaptive_max_disappeared,
+                        max_distance=adaptive_max_distance, detection_stride=detection_stride)
+    ct.next_object_id = id_base
+    unique_objects = {}  # {class_name: set of objectIDs}
+    class_counts = {}    # {class_name: count of unique objects}
+    head, tail_tracks = {}, {}  # {frame index: {objectID: (class_name, box)}}
+    frame_count = 0      # frames written in this range
+
+    inference_conf = config.get('processing.inference_conf', 0.25)
+    batch_size = max(1, int(config.get('processing.batch_size', 4)))
+    renderer = get_renderer()
+    motion_gate = create_motion_gate(job.options.get('motion_gate'))
+
+    # Stage 1 (decoder thread) -> Stage 2 (inference thread) -> Stage 3 (this thread)
+    def run_inference(batch):
+        detect_items = [item for item in batch if 'inf_frame' in item]
+        if not detect_items:
+            return batch
+        names = getattr(model, 'names', None)
+        if tiled:
             try:
-                results = infer_frame(model, inf_frame, conf=config.get('processing.inference_conf', 0.25))
+                with inference_model(model_choice) as instance:
+                    merged = infer_tiled(instance, [item['inf_frame'] for item in detect_items],
+                                         conf=inference_conf, names=names)
             except Exception as e:
-                print(f"Frame inference failed: {e}")
-                results = []
-            
-            # 3. Annotation (on original high-res frame)
-            annotated_frame = raw_frame.copy()
-            inv_scale = 1.0 / scale_inference
-            
-            if results and len(results) > 0 and results[0].boxes:
-                for box in results[0].boxes:
-                    try:
-                        # Rescale boxes back to original resolution
-                        coords = box.xyxy[0].cpu().numpy()
-                        x1 = int(coords[0] * inv_scale)
-                        y1 = int(coords[1] * inv_scale)
-                        x2 = int(coords[2] * inv_scale)
-                        y2 = int(coords[3] * inv_scale)
-                        
-                        conf = float(box.conf[0])
-                        cls_id = int(box.cls[0])
-                        
-                        if hasattr(model, 'names') and model.names:
-                            label_text = model.names.get(cls_id, f'Class {cls_id}') if isinstance(model.names, dict) else model.names[cls_id]
-                        else:
-                            label_text = f'Class {cls_id}'
-                        
-                        label = f"{label_text} {conf:.2f}"
-                        
-                        # Draw on original frame (High Res)
-                        thickness = max(1, int(w_orig / 800))
-                        cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 0, 255), thickness)
-                        
-                        font_scale = w_orig / 2400
-                        (w_l, h_l), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
-                        label_height = int(18 * font_scale)
-                        y1_label = max(y1 - label_height, 0) 
-                        cv2.rectangle(annotated_frame, (x1, y1_label), (x1 + w_l, y1_label + label_height), (0, 255, 0), -1)
-                        cv2.putText(annotated_frame, label, (x1, y1_label + int(14 * font_scale)),
-                                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness)
-                    except Exception as draw_err:
-                        print(f"Error drawing box: {draw_err}")
-
-            # 4. FPS Display (on high-res)
+                print(f"Tiled inference failed: {e}")
+                merged = [empty_detections()] * len(detect_items)
+            for item, dets in zip(detect_items, merged):
+                item['detections'] = scale_detections(dets, 1.0 / item['scale'])
+            return batch
+        try:
+            # Shared micro-batching scheduler (or an exclusively borrowed pooled instance)
+            with inference_model(model_choice) as instance:
+                batch_results = infer_batch(instance, [item['inf_frame'] for item in detect_items],
+                                            batch_size=batch_size, conf=inference_conf)
+        except Exception as e:
+            print(f"Batch inference failed: {e}")
+            batch_results = [None] * len(detect_items)
+        # Pull boxes to CPU arrays once per frame, already rescaled to source resolution
+        for item, result in zip(detect_items, batch_results):
+            item['detections'] = extract_detections(result, names, 1.0 / item['scale'])
+        return batch
+
+    pipeline = Pipeline(
+        _decode_batches(cap, batch_size, target_max_width, (target_width, target_height), detection_stride,
+                        start_index=first, end_index=end, output_from=start, motion_gate=motion_gate),
+        stages=[run_inference],
+        maxsize=config.get('processing.pipeline_queue_size', 4),
+        name=f"job-{job.stream_id[:8]}-{start}",
+        interrupt=getattr(cap, 'interrupt', None)  # PipeCapture: don't wait out a stalled upload
+    )
+
+    prev_time = time.time()
+    last_detect_index = 0
+    last_detections = empty_detections()
+    try:
+        for batch in pipeline:
+            # 3. Annotate, write and encode in decode order
             curr_time = time.time()
             dt = curr_time - prev_time if curr_time - prev_time > 0 else 1e-6
-            fps_display = 1.0 / dt
+            fps_display = len(batch) / dt
             prev_time = curr_time
-            cv2.putText(annotated_frame, f"FPS: {fps_display:.1f}", (20, 40), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
-
-            # 5. Tracking Logic
-            rects = []
-            input_class_names = []
-            if results and len(results) > 0 and results[0].boxes:
-                 for box in results[0].boxes:
-                    try:
-                        coords = box.xyxy[0].cpu().numpy()
-                        x1 = int(coords[0] * inv_scale)
-                        y1 = int(coords[1] * inv_scale)
-                        x2 = int(coords[2] * inv_scale)
-                        y2 = int(coords[3] * inv_scale)
-                        
-                        cls_id = int(box.cls[0])
-                        if hasattr(model, 'names') and model.names:
-                            label_text = model.names.get(cls_id, f'Class {cls_id}') if isinstance(model.names, dict) else model.names[cls_id]
-                        else:
-                            label_text = f'Class {cls_id}'
-                        
-                        rects.append((x1, y1, x2, y2))
-                        input_class_names.append(label_text)
-                    except Exception:
+
+            for item in batch:
+                in_warmup = item['index'] <= start
+                # Drawn once, at output resolution; boxes/tracks stay in source coordinates
+                annotated_frame = item['frame']
+                draw_scale = item['out_scale']
+
+                if not item['detect']:
+                    if in_warmup:
                         continue
+                    # Intermediate frame: draw tracker-propagated boxes, counts unchanged
+                    step = (item['index'] - last_detect_index) / detection_stride
+                    tracked_class_names = ct.class_names
+                    predicted = ct.predict(step)
+                    renderer.draw_boxes(annotated_frame, list(predicted.values()),
+                                        [tracked_class_names.get(oid, "Unknown") for oid in predicted], scale=draw_scale)
+                else:
+                    last_detect_index = item['index']
+                    # Static frame (motion gate): feed the tracker the same boxes again,
+                    # which keeps IDs alive and counts unchanged
+                    dets = last_detections if item.get('reuse') else item['detections']
+                    last_detections = dets
+                    rects = dets['xyxy'].astype(int)
+                    input_class_names = dets['labels']
 
-            # Update Tracker
-            objects, obj_class_names = ct.update(rects, input_class_names)
-
-            # Update Stats and Draw ID
-            for (objectID, centroid) in objects.items():
-                class_name = obj_class_names.get(objectID, "Unknown")
-                if class_name not in unique_objects:
-                    unique_objects[class_name] = set()
-                
-                unique_objects[class_name].add(objectID)
-                class_counts[class_name] = len(unique_objects[class_name])
-                
-                if ct.disappeared[objectID] == 0:
-                    text = f"ID {objectID}"
-                    cv2.putText(annotated_frame, text, (centroid[0] - 10, centroid[1] - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
-                    cv2.circle(annotated_frame, (centroid[0], centroid[1]), 3, (0, 255, 0), -1)
-
-            # 6. Video Writer
-            if out_writer is not None:
-                try:
-                    if annotated_frame.shape[1] != target_width or annotated_frame.shape[0] != target_height:
-                         raw_annotated = cv2.resize(annotated_frame, (target_width, target_height))
-                    else:
-                         raw_annotated = annotated_frame
-                    
-                    out_writer.write(raw_annotated)
-                except Exception as e:
-                    print(f"Frame write error: {e}")
-
-            # 7. Encode for Stream
-            quality = config.get('processing.jpeg_quality', 80)
-            success, buffer = cv2.imencode('.jpg', annotated_frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
-            if not success:
-                print("Failed to encode frame to JPEG")
-                continue
-            
-            frame_bytes = bytes(buffer)
-            
-            boundary = b'--frame\r\n'
-            header = b'Content-Type: image/jpeg\r\nContent-Length: ' + str(len(frame_bytes)).encode() + b'\r\n\r\n'
-            footer = b'\r\n'
-            chunk = boundary + header + frame_bytes + footer
-            
-            # 8. In-Memory Stats Update
-            if frame_count % 10 == 0:
-                active_stats[stream_id] = {
-                    'detections': sum(class_counts.values()),
-                    'class_counts': class_counts.copy()
-                }
-
-            yield chunk
+                    # Update Tracker
+                    objects, obj_class_names = ct.update(rects, input_class_names)
+                    disappeared = ct.disappeared
 
-        cap.release()
+                    # Remember visible tracks on frames shared with neighbouring segments
+                    if in_warmup or (tail and end is not None and item['index'] > end - tail):
+                        track_rects = ct.rects
+                        visible = {oid: (obj_class_names.get(oid, "Unknown"), tuple(int(v) for v in track_rects[oid]))
+                                   for oid in objects if disappeared[oid] == 0}
+                        (head if in_warmup else tail_tracks)[item['index']] = visible
+                    if in_warmup:
+                        continue
+
+                    # Annotation (cached label sprites, see utils/annotation.py)
+                    renderer.draw_boxes(annotated_frame, rects, input_class_names, dets['conf'].tolist(), scale=draw_scale)
+
+                    # Update Stats and Draw ID
+                    visible_tracks = []
+                    for (objectID, centroid) in objects.items():
+                        class_name = obj_class_names.get(objectID, "Unknown")
+                        if class_name not in unique_objects:
+                            unique_objects[class_name] = set()
+
+                        unique_objects[class_name].add(objectID)
+                        class_counts[class_name] = len(unique_objects[class_name])
+
+                        if disappeared[objectID] == 0:
+                            visible_tracks.append((objectID, centroid))
+                    renderer.draw_tracks(annotated_frame, visible_tracks, scale=draw_scale)
+
+                frame_count += 1
+
+                # 4. FPS Display
+                renderer.draw_fps(annotated_frame, fps_display)
+
+                # 6. Video Writer (frame is already at the output size)
+                if out_writer is not None:
+                    try:
+                        out_writer.write(annotated_frame)
+                    except Exception as e:
+                        print(f"Frame write error: {e}")
+
+                # 7. Publish for Stream (JPEG-encoded only if and as viewers need it)
+                if should_publish is None or should_publish():
+                    job.publish_frame(PreviewFrame(annotated_frame))
+
+                # 8. In-Memory Stats Update
+                if on_progress is not None and frame_count % 10 == 0:
+                    on_progress(frame_count, class_counts, fps_display,
+                                motion_gate.skipped if motion_gate is not None else 0)
+    finally:
+        if pipeline.close() or hasattr(cap, 'interrupt'):
+            cap.release()
+        else:
+            # Decoder thread still inside read(); the capture is freed with it
+            print(f"Warning: decoder of {job.filepath} did not stop in time, leaving the capture open")
         if out_writer is not None:
             try:
                 out_writer.release()
             except Exception:
                 pass
-        
+
+    if motion_gate is not None:
+        print(f"Motion gate: inference skipped on {motion_gate.skipped} of {motion_gate.checked} detector frames")
+    return {
+        'unique_objects': unique_objects,
+        'class_counts': class_counts,
+        'frames': frame_count,
+        'head': head,
+        'tail': tail_tracks,
+        'fps': fps,
+        'size': (target_width, target_height),
+        'skipped': motion_gate.skipped if motion_gate is not None else 0
+    }
+
+
+def _plan_segments(total_frames):
+    """Split [0, total_frames) into processing.segment_workers time segments.
+
+    Videos shorter than segment_workers * segment_min_frames use fewer
+    segments; a single (0, None) segment means sequential processing.
+    """
+    workers = max(1, int(config.get('processing.segment_workers', 1)))
+    min_frames = max(1, int(config.get('processing.segment_min_frames', 3000)))
+    count = min(workers, total_frames // min_frames) if total_frames > 0 else 1
+    if count < 2:
+        return [(0, None)]
+    bounds = np.linspace(0, total_frames, count + 1).astype(int).tolist()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _concat_videos(parts, output_path, fps, size):
+    """Join segment MP4s in order; stream copy with ffmpeg, else re-encode via OpenCV"""
+    if shutil.which('ffmpeg'):
+        list_file = output_path + '.parts.txt'
+        with open(list_file, 'w') as f:
+            for part in parts:
+                f.write(f"file '{os.path.abspath(part)}'\n")
+        try:
+            subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                            '-i', list_file, '-c', 'copy', '-movflags', '+faststart', output_path], check=True)
+            return
+        except Exception as e:
+            print(f"ffmpeg concat failed, re-encoding: {e}")
+        finally:
+            delete_file(list_file)
+
+    out_writer = _open_writer(output_path, fps, size)
+    if out_writer is None:
+        return
+    for part in parts:
+        cap = cv2.VideoCapture(part)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out_writer.write(frame)
+        cap.release()
+    out_writer.release()
+
+
+def _run_segmented(job, output_path, segments):
+    """Process time segments of one video in parallel and merge the results.
+
+    Each segment re-tracks a short overlap before its start so IDs can be
+    linked across the boundary; per-class counts come from stitch_track_ids.
+    """
+    cap = cv2.VideoCapture(job.filepath)
+    fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
+    cap.release()
+    overlap = max(1, int(fps * config.get('processing.segment_overlap_seconds', 2)))
+    print(f"Segmented processing: {len(segments)} segments, overlap {overlap} frames")
+
+    lock = threading.Lock()
+    running = set(range(len(segments)))
+    progress = {}  # {segment: (frames, class_counts, skipped)}
+
+    def report(i, frames, class_counts, fps_display, skipped):
+        with lock:
+            progress[i] = (frames, dict(class_counts), skipped)
+            merged = {}
+            for _, counts, _ in progress.values():
+                for name, n in counts.items():
+                    merged[name] = merged.get(name, 0) + n
+            total = sum(p[0] for p in progress.values())
+            total_skipped = sum(p[2] for p in progress.values())
+        # Counts are provisional (not yet stitched) until the job finishes
+        job.update_progress(frames=total, detections=sum(merged.values()), class_counts=merged, fps=fps_display,
+                            skipped=total_skipped)
+
+    def run(i):
+        start, end = segments[i]
+        try:
+            return _annotate_range(
+                job, f"{output_path}.part{i}.mp4", start=start, end=end,
+                warmup=overlap if i > 0 else 0,
+                tail=overlap if i < len(segments) - 1 else 0,
+                id_base=i * SEGMENT_ID_BLOCK,
+                # Preview follows the earliest segment still running
+                should_publish=lambda: i == min(running, default=i),
+                on_progress=lambda frames, counts, f, skipped: report(i, frames, counts, f, skipped)
+            )
+        finally:
+            with lock:
+                running.discard(i)
+
+    parts = [f"{output_path}.part{i}.mp4" for i in range(len(segments))]
+    try:
+        with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix=f"seg-{job.stream_id[:8]}") as pool:
+            results = list(pool.map(run, range(len(segments))))
+        _concat_videos(parts, output_path, results[0]['fps'], results[0]['size'])
+    finally:
+        for part in parts:
+            delete_file(part)
+
+    class_counts = stitch_track_ids(results)
+    return class_counts, sum(r['frames'] for r in results), sum(r['skipped'] for r in results)
+
+
+def run_video_job(job, output_folder):
+    """Process a whole video in the background and return its summary stats.
+
+    Writes the annotated MP4, ``.stats.json`` and ``.done`` marker to
+    output_folder and publishes preview frames/progress on the job. Long
+    videos are split into segments processed in parallel when
+    processing.segment_workers > 1.
+    """
+    filepath = job.filepath
+    stream_id = job.stream_id
+    try:
+        output_filename = job.output_filename
+        output_path = os.path.join(output_folder, output_filename)
+
+        cap = cv2.VideoCapture(filepath)
+        opened = cap.isOpened()
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if opened else 0
+        if opened:
+            print(f"Starting job: {stream_id}, model: {job.model_choice}")
+            print(f"Video dims: {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}, "
+                  f"fps: {int(cap.get(cv2.CAP_PROP_FPS)) or 30}, frame count: {total_frames}")
+        cap.release()
+        job.update_progress(total_frames=total_frames)
+
+        # A file still being uploaded can only be read front to back
+        segments = _plan_segments(total_frames) if job.source is None else [(0, None)]
+        if len(segments) > 1:
+            class_counts, frame_count, skipped = _run_segmented(job, output_path, segments)
+        else:
+            def report(frames, counts, fps_display, skipped):
+                job.update_progress(frames=frames, detections=sum(counts.values()),
+                                    class_counts=counts, fps=fps_display, skipped=skipped)
+
+            result = _annotate_range(job, output_path, on_progress=report)
+            class_counts, frame_count, skipped = result['class_counts'], result['frames'], result['skipped']
+            if job.source is not None and (job.source.stalled or not job.source.complete):
+                raise IOError("Upload stopped before the video was complete")
+
         # Save class counts to JSON file
         total_unique = sum(class_counts.values())
         stats_file = output_path + '.stats.json'
         try:
             with open(stats_file, 'w') as f:
                 json.dump({
-                    'detections': total_unique, 
+                    'detections': total_unique,
                     'class_counts': class_counts,
-                    'frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if hasattr(cap, 'get') else frame_count,
+                    'frames': total_frames or frame_count,
+                    'inference_skipped': skipped,
                     'filename': output_filename
                 }, f)
             print(f"Saved stats: {total_unique} unique objects, {len(class_counts)} classes, frames: {frame_count}")
         except Exception as e:
             print(f"Error saving stats: {e}")
-        
-        # Record Global Stats
-        global_stats.record(user_name, total_unique, class_counts)
-        
+
         # Create a marker file
         marker_file = output_path + '.done'
         try:
@@ -261,10 +656,19 @@ def generate_frames(filepath, model_choice, user_name, stream_id, config, global
         except Exception:
             pass
 
-        if stream_id in active_stats:
-            del active_stats[stream_id]
-        
         # Immediate Cleanup of Original Upload for Video
         delete_file(filepath)
+
+        return {
+            'detections': total_unique,
+            'class_counts': class_counts,
+            'frames': total_frames or frame_count,
+            'inference_skipped': skipped
+        }
     except Exception as e:
-        print(f"Stream error: {e}")
+        print(f"Job error: {e}")
+        # An upload still arriving keeps its file: /upload/<id>/complete
+        # processes it again once the last chunk is in
+        if job.source is None or job.source.finished:
+            delete_file(filepath)
+        raise
@@ -144,6 +144,137 @@ function updateCategoryStats(classCounts) {
 
 // Global variables for session management
 let activePollInterval = null;
+let activeEvents = null;
+let activeStreamId = null;
+
+// Large videos are sent in resumable chunks; the server may start
+// decoding before the last chunk arrives and report a stream_id early
+const CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024;
+const VIDEO_EXT = /\.(mp4|avi|mov|mkv)$/i;
+
+async function uploadChunked(file, fields, onStream) {
+    const initRes = await fetch('/upload/init', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, ...fields })
+    });
+    const init = await initRes.json();
+    if (!initRes.ok) throw new Error(init.error);
+
+    const chunkSize = init.chunk_size || 8 * 1024 * 1024;
+    let offset = init.offset || 0;
+    let retries = 0;
+    while (offset < file.size) {
+        try {
+            const r = await fetch(`/upload/${init.upload_id}?offset=${offset}`, {
+                method: 'PUT',
+                body: file.slice(offset, offset + chunkSize)
+            });
+            const d = await r.json();
+            if (!r.ok && r.status !== 409) throw new Error(d.error);
+            offset = d.offset;  // 409: resume from the server's offset
+            retries = 0;
+            if (d.stream_id && onStream) {
+                onStream(d.stream_id);
+                onStream = null;
+            }
+        } catch (err) {
+            // Dropped connection: ask the server where to resume
+            if (++retries > 3) throw err;
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            const p = await fetch(`/upload/${init.upload_id}`);
+            if (p.ok) offset = (await p.json()).offset;
+        }
+    }
+
+    const res = await fetch(`/upload/${init.upload_id}/complete`, { method: 'POST' });
+    const data = await res.json();
+    if (!res.ok) throw new Error(data.error);
+    return data;
+}
+
+function showResultArea() {
+    loading.style.display = 'none';
+    submitBtn.disabled = false;
+    resultArea.style.display = 'flex';
+    document.getElementById('reportDate').innerText = "ASSESSMENT COMPLETED • " + new Date().toLocaleDateString();
+}
+
+function stopWatching() {
+    if (activePollInterval) {
+        clearInterval(activePollInterval);
+        activePollInterval = null;
+    }
+    if (activeEvents) {
+        activeEvents.close();
+        activeEvents = null;
+    }
+}
+
+// Apply one status update; returns true once the job has finished
+function applyStatus(s) {
+    // Update counts
+    document.getElementById('objCount').innerText = s.detections;
+    updateCategoryStats(s.class_counts);
+    document.getElementById('classDetails').innerHTML = formatCounts(s.class_counts);
+
+    if (s.status === 'error') {
+        errorDiv.innerText = "Assessment Error: " + s.error;
+        errorDiv.style.display = 'block';
+        // A chunked upload may rerun the job under the same id once complete
+        activeStreamId = null;
+        return true;
+    }
+    if (s.ready) {
+        assessPollution(s.detections, s.frames / 30);
+        renderChart(s.class_counts || {});
+        document.getElementById('dlBtn').href = `/download/${s.filename}`;
+        fetchGlobalStats();
+        return true;
+    }
+    return false;
+}
+
+function pollStatus(streamId) {
+    activePollInterval = setInterval(async () => {
+        try {
+            const r = await fetch(`/status/${streamId}`);
+            if (applyStatus(await r.json())) stopWatching();
+        } catch (err) {
+            console.error("Polling error:", err);
+        }
+    }, 500);
+}
+
+// Progress is pushed over Server-Sent Events; polling is the fallback
+function watchStatus(streamId) {
+    if (!window.EventSource) {
+        pollStatus(streamId);
+        return;
+    }
+    activeEvents = new EventSource(`/events/${streamId}`);
+    activeEvents.onmessage = (e) => {
+        if (applyStatus(JSON.parse(e.data))) stopWatching();
+    };
+    activeEvents.onerror = () => {
+        // Stream dropped before the job finished
+        if (!activeEvents) return;
+        activeEvents.close();
+        activeEvents = null;
+        pollStatus(streamId);
+    };
+}
+
+function showVideo(streamId) {
+    if (activeStreamId === streamId) return;
+    activeStreamId = streamId;
+    errorDiv.style.display = 'none';
+    showResultArea();
+
+    mainDisplay.src = `/stream/${streamId}?t=${Date.now()}`;
+    document.getElementById('fpsBlock').style.display = 'block';
+    watchStatus(streamId);
+}
 
 // Init stats
 fetchGlobalStats();
@@ -154,10 +285,7 @@ form.onsubmit = async (e) => {
     if (!fileInput.files.length) return;
 
     // 1. Reset Global State & Clear Polling
-    if (activePollInterval) {
-        clearInterval(activePollInterval);
-        activePollInterval = null;
-    }
+    stopWatching();
 
     loading.style.display = 'block';
     resultArea.style.display = 'none';
@@ -171,18 +299,26 @@ form.onsubmit = async (e) => {
     document.getElementById('stat-rov').innerText = "0";
     document.getElementById('classDetails').innerHTML = "Initializing neural analysis...";
 
+    activeStreamId = null;
     const fd = new FormData(form);
+    // Send the switches either way, so unchecking overrides the server default
+    for (const name of ['motion_gate', 'tiled']) fd.set(name, fd.get(name) ? '1' : '0');
+    // The precision variant travels in the model field, e.g. 'v8-int8'
+    if (fd.get('precision')) fd.set('model', `${fd.get('model')}-${fd.get('precision')}`);
+    fd.delete('precision');
+    const file = fileInput.files[0];
     try {
-        const res = await fetch('/upload', { method: 'POST', body: fd });
-        const data = await res.json();
-        if (!res.ok) throw new Error(data.error);
-
-        loading.style.display = 'none';
-        submitBtn.disabled = false;
-        resultArea.style.display = 'flex';
-        document.getElementById('reportDate').innerText = "ASSESSMENT COMPLETED • " + new Date().toLocaleDateString();
+        let data;
+        if (file.size > CHUNKED_UPLOAD_THRESHOLD && VIDEO_EXT.test(file.name)) {
+            data = await uploadChunked(file, { model: fd.get('model'), contributor: fd.get('contributor'), motion_gate: fd.get('motion_gate'), tiled: fd.get('tiled') }, showVideo);
+        } else {
+            const res = await fetch('/upload', { method: 'POST', body: fd });
+            data = await res.json();
+            if (!res.ok) throw new Error(data.error);
+        }
 
         if (data.type === 'image') {
+            showResultArea();
             mainDisplay.src = `/image/${data.filename}`;
             document.getElementById('objCount').innerText = data.detections;
             document.getElementById('classDetails').innerHTML = formatCounts(data.class_counts);
@@ -196,31 +332,7 @@ form.onsubmit = async (e) => {
                 fetchGlobalStats();
             }, 1000);
         } else {
-            mainDisplay.src = `/stream/${data.stream_id}?t=${Date.now()}&model=${data.model}&contributor=${encodeURIComponent(data.contributor)}`;
-            document.getElementById('fpsBlock').style.display = 'block';
-
-            activePollInterval = setInterval(async () => {
-                try {
-                    const r = await fetch(`/status/${data.stream_id}`);
-                    const s = await r.json();
-
-                    // Update counts
-                    document.getElementById('objCount').innerText = s.detections;
-                    updateCategoryStats(s.class_counts);
-                    document.getElementById('classDetails').innerHTML = formatCounts(s.class_counts);
-
-                    if (s.ready) {
-                        clearInterval(activePollInterval);
-                        activePollInterval = null;
-                        assessPollution(s.detections, s.frames / 30);
-                        renderChart(s.class_counts || {});
-                        document.getElementById('dlBtn').href = `/download/${s.filename}`;
-                        fetchGlobalStats();
-                    }
-                } catch (err) {
-                    console.error("Polling error:", err);
-                }
-            }, 500);
+            showVideo(data.stream_id);
         }
         window.scrollTo({ top: resultArea.offsetTop - 100, behavior: 'smooth' });
     } catch (e) {
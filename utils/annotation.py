@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+BOX_COLOR = (0, 0, 255)
+LABEL_COLOR = (0, 255, 0)
+LABEL_TEXT_COLOR = (0, 0, 0)
+TRACK_COLOR = (0, 255, 0)
+
+
+class AnnotationStyle:
+    """Line and font sizes for frames of one width"""
+
+    def __init__(self, width):
+        self.width = width
+        self.thickness = max(1, int(width / 800))
+        self.font_scale = width / 2400
+        self.label_height = int(18 * self.font_scale)
+        self.text_offset = int(14 * self.font_scale)
+
+
+class Sprite:
+    """Pre-rendered overlay: BGR pixels, an optional 8-bit mask of the pixels
+    to paint (None = opaque) and the offset of its drawing origin"""
+
+    def __init__(self, image, mask, anchor):
+        self.image = image
+        self.mask = mask
+        self.anchor = anchor  # (dx, dy) of the drawing origin inside image
+
+    def blit(self, frame, x, y):
+        """Paint the sprite with its origin at (x, y), clipped to the frame"""
+        h, w = self.image.shape[:2]
+        x0, y0 = x - self.anchor[0], y - self.anchor[1]
+        fx0, fy0 = max(x0, 0), max(y0, 0)
+        fx1, fy1 = min(x0 + w, frame.shape[1]), min(y0 + h, frame.shape[0])
+        if fx0 >= fx1 or fy0 >= fy1:
+            return
+        sx0, sy0 = fx0 - x0, fy0 - y0
+        sx1, sy1 = sx0 + (fx1 - fx0), sy0 + (fy1 - fy0)
+        if self.mask is None:
+            frame[fy0:fy1, fx0:fx1] = self.image[sy0:sy1, sx0:sx1]
+        else:
+            cv2.copyTo(self.image[sy0:sy1, sx0:sx1], self.mask[sy0:sy1, sx0:sx1], frame[fy0:fy1, fx0:fx1])
+
+
+def draw_rect_outline(frame, x1, y1, x2, y2, color, thickness=1):
+    """Box outline as nested 1px rectangles, centred on the box edge like a
+    thick cv2.rectangle but several times cheaper than its thick-line path"""
+    lo = thickness // 2
+    for d in range(-lo, thickness - lo):
+        cv2.rectangle(frame, (x1 - d, y1 - d), (x2 + d, y2 + d), color, 1)
+
+
+class AnnotationRenderer:
+    """Draws detection boxes, labels, track IDs and the FPS overlay.
+
+    Sizes are computed once per frame width, and label images (class plus
+    confidence bucket, track IDs) are rendered once and then blitted, so a
+    box costs a few 1px rectangles and a slice copy instead of getTextSize, two
+    rectangles and a putText. Sprites live in a bounded LRU cache shared by
+    all jobs. Boxes may be given in source coordinates with ``scale`` to
+    draw on a resized frame.
+    """
+
+    def __init__(self, conf_step=0.01, max_sprites=4096):
+        self.conf_step = conf_step
+        self.max_sprites = max_sprites
+        self._styles = {}
+        self._sprites = OrderedDict()
+        self._lock = threading.Lock()
+
+    def style(self, width):
+        style = self._styles.get(width)
+        if style is None:
+            style = self._styles[width] = AnnotationStyle(width)
+        return style
+
+    def _cached(self, key, render):
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                return sprite
+        sprite = render()
+        with self._lock:
+            self._sprites[key] = sprite
+            while len(self._sprites) > self.max_sprites:
+                self._sprites.popitem(last=False)
+        return sprite
+
+    def label_text(self, class_name, conf=None):
+        if conf is None:
+            return class_name
+        if self.conf_step > 0:
+            conf = round(conf / self.conf_step) * self.conf_step
+        return f"{class_name} {conf:.2f}"
+
+    def label_sprite(self, text, style):
+        """Green label box with black text, origin at the box's top-left corner.
+
+        The box is grown to cover the glyphs, so the sprite is opaque.
+        """
+        def render():
+            (w_l, h_l), baseline = cv2.getTextSize(text, FONT, style.font_scale, style.thickness)
+            top = max(0, h_l + style.thickness - style.text_offset)
+            height = top + max(style.label_height + 1, style.text_offset + baseline + style.thickness)
+            image = np.empty((height, w_l + style.thickness + 1, 3), dtype=np.uint8)
+            image[:] = LABEL_COLOR
+            cv2.putText(image, text, (0, top + style.text_offset), FONT, style.font_scale,
+                        LABEL_TEXT_COLOR, style.thickness)
+            return Sprite(image, None, (0, top))
+        return self._cached(('label', text, style.width), render)
+
+    def track_sprite(self, object_id):
+        """'ID n' text, origin at its baseline"""
+        text = f"ID {object_id}"
+
+        def render():
+            (w_t, h_t), baseline = cv2.getTextSize(text, FONT, 0.4, 1)
+            size = (h_t + baseline + 3, w_t + 2)
+            mask = np.zeros(size, dtype=np.uint8)
+            cv2.putText(mask, text, (0, h_t + 1), FONT, 0.4, 255, 1)
+            mask[mask < 128] = 0
+            image = np.empty(size + (3,), dtype=np.uint8)
+            image[:] = TRACK_COLOR
+            return Sprite(image, mask, (0, h_t + 1))
+        return self._cached(('track', text), render)
+
+    def draw_boxes(self, frame, boxes, labels, confs=None, scale=1.0):
+        """Draw labelled boxes; boxes is an (N, 4) xyxy array"""
+        if len(labels) == 0:
+            return
+        style = self.style(frame.shape[1])
+        rects = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        rects = (rects * scale).astype(int) if scale != 1.0 else rects.astype(int)
+        confs = [None] * len(labels) if confs is None else confs
+        for (x1, y1, x2, y2), label, conf in zip(rects.tolist(), labels, confs):
+            draw_rect_outline(frame, x1, y1, x2, y2, BOX_COLOR, style.thickness)
+            sprite = self.label_sprite(self.label_text(label, conf), style)
+            sprite.blit(frame, x1, max(y1 - style.label_height, 0))
+
+    def draw_tracks(self, frame, tracks, scale=1.0):
+        """Draw 'ID n' and a dot for each (objectID, (cx, cy)) in tracks"""
+        for object_id, (cx, cy) in tracks:
+            cx, cy = int(cx * scale), int(cy * scale)
+            self.track_sprite(object_id).blit(frame, cx - 10, cy - 10)
+            cv2.circle(frame, (cx, cy), 3, TRACK_COLOR, -1)
+
+    def draw_fps(self, frame, fps):
+        cv2.putText(frame, f"FPS: {fps:.1f}", (20, 40), FONT, 1.0, TRACK_COLOR, 2)
+
+
+_renderer = None
+
+
+def get_renderer():
+    """Process-wide renderer, configured from processing.annotation_conf_step"""
+    global _renderer
+    if _renderer is None:
+        from .config_loader import config
+        _renderer = AnnotationRenderer(conf_step=config.get('processing.annotation_conf_step', 0.01))
+    return _renderer
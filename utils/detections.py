@@ -0,0 +1,58 @@
+import numpy as np
+
+
+def class_label(names, cls_id):
+    """Resolve a class id against a model/result ``names`` dict or list"""
+    if names:
+        if isinstance(names, dict):
+            return names.get(cls_id, f'Class {cls_id}')
+        if 0 <= cls_id < len(names):
+            return names[cls_id]
+    return f'Class {cls_id}'
+
+
+def empty_detections():
+    return {
+        'xyxy': np.zeros((0, 4), dtype=np.float32),
+        'conf': np.zeros(0, dtype=np.float32),
+        'cls': np.zeros(0, dtype=np.int64),
+        'labels': []
+    }
+
+
+def extract_detections(result, names=None, scale=1.0):
+    """Pull boxes out of one ultralytics Results in a single transfer.
+
+    Reads ``boxes.data`` (x1, y1, x2, y2, [track id,] conf, cls) with one
+    ``.cpu().numpy()`` call instead of indexing every box, and rescales all
+    coordinates with one multiply. Returns a dict of contiguous arrays
+    ``xyxy`` (N, 4) float32, ``conf`` (N,), ``cls`` (N,) int plus the
+    matching ``labels`` list, shared by the annotator and the tracker.
+    """
+    if result is None:
+        return empty_detections()
+    boxes = getattr(result, 'boxes', None)
+    if boxes is None or len(boxes) == 0:
+        return empty_detections()
+
+    data = boxes.data
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    data = np.asarray(data, dtype=np.float32)
+
+    xyxy = data[:, :4]
+    if scale != 1.0:
+        xyxy = xyxy * np.float32(scale)
+    cls = data[:, -1].astype(np.int64)
+
+    if not names:
+        names = getattr(result, 'names', None)
+    # Resolve each distinct class once rather than once per box
+    lookup = {c: class_label(names, c) for c in np.unique(cls).tolist()}
+
+    return {
+        'xyxy': np.ascontiguousarray(xyxy),
+        'conf': np.ascontiguousarray(data[:, -2]),
+        'cls': cls,
+        'labels': [lookup[c] for c in cls.tolist()]
+    }
@@ -0,0 +1,228 @@
+import os
+import ast
+import cv2
+import numpy as np
+
+
+def exported_path(weights_path, backend):
+    """Location of the exported artifact, cached next to the .pt weights"""
+    stem = os.path.splitext(weights_path)[0]
+    if backend == 'openvino':
+        return f"{stem}_openvino_model"
+    if backend == 'onnx-int8':
+        return f"{stem}.int8.onnx"
+    return f"{stem}.onnx"
+
+
+def _is_fresh(artifact, weights_path):
+    """True if artifact exists and is not older than the source weights"""
+    if not os.path.exists(artifact):
+        return False
+    if not os.path.exists(weights_path):
+        return True
+    return os.path.getmtime(artifact) >= os.path.getmtime(weights_path)
+
+
+def quantize_onnx(src, dst):
+    """Dynamic INT8 quantization of an FP32 ONNX model (weights int8, activations quantized at runtime)"""
+    import onnx
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print(f"Quantizing {src} to INT8...")
+    quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+
+    # Keep the class names from the FP32 export's metadata
+    fp32_meta = {p.key: p.value for p in onnx.load(src, load_external_data=False).metadata_props}
+    quantized = onnx.load(dst)
+    present = {p.key for p in quantized.metadata_props}
+    for key, value in fp32_meta.items():
+        if key not in present:
+            quantized.metadata_props.append(onnx.StringStringEntryProto(key=key, value=value))
+    onnx.save(quantized, dst)
+    return dst
+
+
+def export_model(torch_model, weights_path, backend, imgsz=640):
+    """Export torch_model to ONNX/OpenVINO once and return the cached artifact path"""
+    artifact = exported_path(weights_path, backend)
+    if _is_fresh(artifact, weights_path):
+        return artifact
+
+    if backend == 'onnx-int8':
+        fp32 = export_model(torch_model, weights_path, 'onnx', imgsz=imgsz)
+        return quantize_onnx(fp32, artifact)
+
+    print(f"Exporting {weights_path} to {backend} (one-time)...")
+    fmt = 'openvino' if backend == 'openvino' else 'onnx'
+    out = torch_model.export(format=fmt, imgsz=imgsz, dynamic=True, half=False)
+    if out and os.path.abspath(str(out)) != os.path.abspath(artifact) and os.path.exists(str(out)):
+        os.replace(str(out), artifact)
+    print(f"Exported model cached at {artifact}")
+    return artifact
+
+
+def _parse_names(raw):
+    """ultralytics stores class names in export metadata as a dict literal"""
+    if not raw:
+        return {}
+    try:
+        names = ast.literal_eval(raw) if isinstance(raw, str) else raw
+        return {int(k): v for k, v in dict(names).items()}
+    except Exception:
+        return {}
+
+
+def letterbox(frame, size):
+    """Resize keeping aspect ratio and pad to size x size (ultralytics-style)"""
+    h, w = frame.shape[:2]
+    r = min(size / h, size / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    if (new_w, new_h) != (w, h):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = frame
+    return canvas, r, left, top
+
+
+class ExportedModel:
+    """ONNX Runtime / OpenVINO detector with the model.predict() contract.
+
+    predict() returns ultralytics Results objects, so infer_frame and
+    infer_batch work unchanged. Handles YOLOv8/YOLOv11 heads (B, 4+nc, N)
+    with NMS and RT-DETR heads (B, Q, 4+nc) without NMS. backend is 'onnx',
+    'onnx-int8' (dynamically quantized ONNX) or 'openvino'.
+    """
+
+    def __init__(self, path, backend='onnx', task='yolo', intra_op_threads=0):
+        self.path = path
+        self.backend = backend
+        self.task = task
+        self.names = {}
+        self.fixed_batch = None
+        self.fixed_size = None
+
+        if backend == 'openvino':
+            self._init_openvino(path, intra_op_threads)
+        else:
+            self._init_onnx(path, intra_op_threads)
+
+    def _init_onnx(self, path, intra_op_threads):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self._read_input_shape(inp.shape)
+        self.names = _parse_names(self.session.get_modelmeta().custom_metadata_map.get('names'))
+        self._run = lambda blob: self.session.run(None, {self.input_name: blob})[0]
+
+    def _init_openvino(self, path, intra_op_threads):
+        import openvino as ov
+        core = ov.Core()
+        xml = path
+        if os.path.isdir(path):
+            xml = next(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.xml'))
+        ov_model = core.read_model(xml)
+        props = {'PERFORMANCE_HINT': 'THROUGHPUT'}
+        if intra_op_threads:
+            props['INFERENCE_NUM_THREADS'] = int(intra_op_threads)
+        self.compiled = core.compile_model(ov_model, 'CPU', props)
+        shape = [d.get_length() if d.is_static else None for d in ov_model.input(0).get_partial_shape()]
+        self._read_input_shape(shape)
+        meta = os.path.join(os.path.dirname(xml), 'metadata.yaml')
+        if os.path.exists(meta):
+            import yaml
+            with open(meta, 'r') as f:
+                self.names = _parse_names((yaml.safe_load(f) or {}).get('names'))
+        self._run = lambda blob: self.compiled(blob)[0]
+
+    def _read_input_shape(self, shape):
+        batch, _, h, w = (list(shape) + [None] * 4)[:4]
+        self.fixed_batch = batch if isinstance(batch, int) else None
+        self.fixed_size = h if isinstance(h, int) and isinstance(w, int) else None
+
+    def to(self, device):
+        raise RuntimeError(f"{self.backend} backend runs on CPU only")
+
+    def predict(self, source, conf=0.25, iou=0.7, imgsz=640, half=False, verbose=False, **kwargs):
+        from ultralytics.engine.results import Results
+
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        size = self.fixed_size or int(imgsz)
+
+        prepared = [letterbox(f, size) for f in frames]
+        blob = np.stack([p[0] for p in prepared])[..., ::-1].transpose(0, 3, 1, 2)
+        blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+
+        if self.fixed_batch and self.fixed_batch != len(frames):
+            outputs = np.concatenate([self._run(blob[i:i + 1]) for i in range(len(frames))])
+        else:
+            outputs = self._run(blob)
+
+        results = []
+        for frame, (_, r, left, top), out in zip(frames, prepared, outputs):
+            boxes = self._postprocess(out, conf, iou, size)
+            if len(boxes):
+                # Undo letterbox: remove padding, rescale, clip to the frame
+                boxes[:, [0, 2]] = (boxes[:, [0, 2]] - left) / r
+                boxes[:, [1, 3]] = (boxes[:, [1, 3]] - top) / r
+                h, w = frame.shape[:2]
+                boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+                boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+            results.append(Results(orig_img=frame, path=None, names=self.names, boxes=boxes))
+        return results
+
+    __call__ = predict
+
+    def _postprocess(self, out, conf, iou, size):
+        """Decode one image's raw head output to an (N, 6) xyxy/conf/cls array"""
+        if self.task == 'rtdetr':
+            preds = out  # (Q, 4 + nc), boxes as normalized cx, cy, w, h
+            xywh = preds[:, :4] * size
+        else:
+            preds = out.T  # (N, 4 + nc), boxes as cx, cy, w, h in input pixels
+            xywh = preds[:, :4]
+
+        scores = preds[:, 4:]
+        cls = scores.argmax(axis=1)
+        best = scores[np.arange(len(scores)), cls]
+        keep = best > conf
+        if not keep.any():
+            return np.zeros((0, 6), dtype=np.float32)
+        xywh, best, cls = xywh[keep], best[keep], cls[keep]
+
+        xyxy = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+        if self.task != 'rtdetr':
+            # Class-aware NMS in one OpenCV call
+            tl_wh = np.concatenate([xyxy[:, :2], xywh[:, 2:]], axis=1)
+            idx = cv2.dnn.NMSBoxesBatched(tl_wh.tolist(), best.tolist(), cls.tolist(), conf, iou)
+            idx = np.asarray(idx, dtype=np.int64).reshape(-1)
+            xyxy, best, cls = xyxy[idx], best[idx], cls[idx]
+
+        return np.concatenate([xyxy, best[:, None], cls[:, None]], axis=1).astype(np.float32)
+
+
+def load_exported_model(model_type, weights_path, backend, load_torch_model, imgsz=640, intra_op_threads=0):
+    """Serve model_type through an exported ONNX/OpenVINO artifact.
+
+    The torch model is only loaded (via load_torch_model) when the cached
+    artifact is missing or older than the weights.
+    """
+    artifact = exported_path(weights_path, backend)
+    if not _is_fresh(artifact, weights_path):
+        fp32 = exported_path(weights_path, 'onnx')
+        if backend == 'onnx-int8' and _is_fresh(fp32, weights_path):
+            # Quantize the cached FP32 export without reloading PyTorch
+            artifact = quantize_onnx(fp32, artifact)
+        else:
+            artifact = export_model(load_torch_model(), weights_path, backend, imgsz=imgsz)
+
+    task = 'rtdetr' if model_type == 'rtdetr' else 'yolo'
+    model = ExportedModel(artifact, backend=backend, task=task, intra_op_threads=intra_op_threads)
+    print(f"Serving {model_type} via {backend} ({artifact})")
+    return model
@@ -0,0 +1,171 @@
+import time
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import Future
+
+from .config_loader import config
+from .model import get_pool, infer_batch, _resolve_type
+
+
+class _Request:
+    def __init__(self, frames, conf):
+        self.frames = frames
+        self.conf = conf
+        self.future = Future()
+
+
+class InferenceScheduler:
+    """Dynamic micro-batching shared by every upload and video job.
+
+    Callers submit frames for a model type and get a Future back. One
+    dispatcher thread per pooled model instance takes the first waiting
+    request, keeps collecting more for up to ``max_wait_ms`` (or until
+    ``max_batch`` frames are queued), runs one batched predict and hands
+    each caller its own slice of the results. Under concurrent load this
+    replaces many parallel batch-size-1 calls with a few full batches.
+    """
+
+    def __init__(self, max_batch=8, max_wait_ms=10, workers_per_model=None):
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.workers_per_model = workers_per_model
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.stats = {'batches': 0, 'frames': 0, 'requests': 0}
+
+    def _queue_for(self, model_type):
+        q = self._queues.get(model_type)
+        if q is not None:
+            return q
+        with self._lock:
+            q = self._queues.get(model_type)
+            if q is None:
+                pool = get_pool(model_type)
+                q = queue.Queue()
+                workers = self.workers_per_model or pool.size
+                for i in range(max(1, int(workers))):
+                    threading.Thread(target=self._dispatch, args=(pool, q), daemon=True,
+                                     name=f"infer-{model_type}-{i}").start()
+                self._queues[model_type] = q
+        return q
+
+    def submit(self, model_type, frames, conf=None):
+        """Queue frames for model_type; the Future resolves to one Results per frame"""
+        if conf is None:
+            conf = config.get('processing.inference_conf', 0.25)
+        request = _Request(list(frames), conf)
+        if not request.frames:
+            request.future.set_result([])
+            return request.future
+        self._queue_for(_resolve_type(model_type)).put(request)
+        return request.future
+
+    def infer(self, model_type, frames, conf=None):
+        """Blocking submit()"""
+        return self.submit(model_type, frames, conf).result()
+
+    def _collect(self, q):
+        """Block for one request, then gather more until the batch is full or max_wait passes"""
+        pending = [q.get()]
+        count = len(pending[0].frames)
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                request = q.get(timeout=remaining) if remaining > 0 else q.get_nowait()
+            except queue.Empty:
+                break
+            pending.append(request)
+            count += len(request.frames)
+        return pending
+
+    def _dispatch(self, pool, q):
+        while True:
+            pending = self._collect(q)
+            # Requests with different thresholds cannot share a predict call
+            by_conf = {}
+            for request in pending:
+                by_conf.setdefault(request.conf, []).append(request)
+            for conf, group in by_conf.items():
+                self._run(pool, group, conf)
+
+    def _run(self, pool, group, conf):
+        frames = [f for request in group for f in request.frames]
+        try:
+            with pool.acquire() as model:
+                results = infer_batch(model, frames, batch_size=self.max_batch, conf=conf)
+        except Exception as e:
+            for request in group:
+                request.future.set_exception(e)
+            return
+
+        with self._lock:
+            self.stats['batches'] += (len(frames) + self.max_batch - 1) // self.max_batch
+            self.stats['frames'] += len(frames)
+            self.stats['requests'] += len(group)
+
+        start = 0
+        for request in group:
+            n = len(request.frames)
+            request.future.set_result(results[start:start + n])
+            start += n
+
+
+class ScheduledModel:
+    """Stand-in for a model whose predict() goes through the scheduler.
+
+    Exposes ``names`` and the predict() contract, so infer_frame,
+    infer_batch and process_image work with it unchanged.
+    """
+
+    def __init__(self, scheduler, model_type):
+        self.scheduler = scheduler
+        self.model_type = _resolve_type(model_type)
+        self.names = getattr(get_pool(self.model_type).primary, 'names', None)
+
+    def predict(self, source, conf=None, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        return self.scheduler.infer(self.model_type, frames, conf=conf)
+
+    __call__ = predict
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_scheduler_disabled = False  # set in job worker processes, see disable_scheduler()
+
+
+def disable_scheduler():
+    """Run inference on pooled instances in this process, whatever processing.scheduler_enabled says.
+
+    For job worker processes: the scheduler exists to share predict calls
+    between concurrent jobs, and a worker only ever runs one.
+    """
+    global _scheduler_disabled
+    _scheduler_disabled = True
+
+
+def get_scheduler():
+    """Process-wide scheduler configured from processing.scheduler_*"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = InferenceScheduler(
+                    max_batch=config.get('processing.scheduler_max_batch', 8),
+                    max_wait_ms=config.get('processing.scheduler_max_wait_ms', 10)
+                )
+    return _scheduler
+
+
+def inference_model(model_type=None):
+    """Context manager yielding the model object to run inference with.
+
+    With processing.scheduler_enabled this is a ScheduledModel sharing
+    micro-batches with every other caller; otherwise a pooled instance
+    borrowed exclusively for the duration of the block.
+    """
+    if config.get('processing.scheduler_enabled', True) and not _scheduler_disabled:
+        return nullcontext(ScheduledModel(get_scheduler(), model_type))
+    return get_pool(model_type).acquire()
@@ -1,5 +1,10 @@
 from ultralytics import YOLO, RTDETR
 import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
 
 from .config_loader import config
 
@@ -10,70 +15,286 @@ YOLOV11_MODEL_PATH = os.path.join(MODELS_DIR, config.get('models.yolov11', 'yolo
 RTDETR_MODEL_PATH = os.path.join(MODELS_DIR, config.get('models.rtdetr', 'rtdetr.pt'))
 
 # Load models (lazy loading saat dibutuhkan)
+# models: model_type -> primary instance (kept for backwards compatibility)
+# pools: model_type -> ModelPool of interchangeable instances
 models = {}
+pools = {}
+_registry_lock = threading.Lock()
+_load_locks = {}
+_warned_types = set()
+_pool_size = None  # overrides models.pool_size in this process, see set_pool_size()
 
-def get_model(model_type=None):
-    """Get atau load model YOLOv8 atau RT-DETR"""
+# Precision variants selectable as '<model>-<variant>', e.g. 'v8-int8'
+PRECISION_VARIANTS = ('int8', 'fp16')
+
+def _weights_path(model_type):
+    if model_type == 'rtdetr':
+        return RTDETR_MODEL_PATH
+    if model_type == 'v11':
+        return YOLOV11_MODEL_PATH
+    return YOLOV8_MODEL_PATH
+
+
+def _load_torch_model(model_type):
+    """Load the PyTorch weights for model_type, on GPU when available"""
+    path = _weights_path(model_type)
+    if model_type == 'rtdetr':
+        print(f"Loading RT-DETR from {path}...")
+        model = RTDETR(path)
+    elif model_type == 'v11':
+        print(f"Loading YOLOv11 from {path}...")
+        model = YOLO(path)
+    else:
+        # Default to YOLOv8
+        print(f"Loading YOLOv8 from {path}...")
+        model = YOLO(path)
+
+    # Move to GPU if available
+    try:
+        model.to("cuda:0")
+    except Exception as e:
+        print(f"Info: Could not move model {model_type} to GPU: {e}")
+    return model
+
+
+def _resolve_type(model_type):
+    """Default model_type and drop unknown variant suffixes ('v8-foo' -> 'v8')"""
     if model_type is None:
         model_type = config.get('models.default', 'v8')
-    
-    if model_type not in models:
-        try:
-            if model_type == 'rtdetr':
-                path = RTDETR_MODEL_PATH
-                print(f"Loading RT-DETR from {path}...")
-                model = RTDETR(path)
-            elif model_type == 'v11':
-                path = YOLOV11_MODEL_PATH
-                print(f"Loading YOLOv11 from {path}...")
-                model = YOLO(path)
-            else:
-                # Default to YOLOv8
-                path = YOLOV8_MODEL_PATH
-                print(f"Loading YOLOv8 from {path}...")
-                model = YOLO(path)
-            
-            # Move to GPU if available
+    base_type, _, variant = model_type.partition('-')
+    if variant and variant not in PRECISION_VARIANTS:
+        if model_type not in _warned_types:
+            _warned_types.add(model_type)
+            print(f"Info: Unknown model variant '{variant}', using {base_type}")
+        return base_type
+    return model_type
+
+
+def _load_model(model_type):
+    """Load one instance of model_type (already resolved) from disk"""
+    base_type, _, variant = model_type.partition('-')
+    try:
+        backend = config.get('models.backend', 'torch')
+        if variant == 'int8':
+            backend = 'onnx-int8'
+        elif variant == 'fp16':
+            backend = 'torch'
+
+        model = None
+        if backend in ('onnx', 'onnx-int8', 'openvino'):
+            # Exported CPU backend; falls back to PyTorch if unavailable
             try:
-                model.to("cuda:0")
+                from .exported_model import load_exported_model
+                model = load_exported_model(
+                    base_type, _weights_path(base_type), backend,
+                    load_torch_model=lambda: _load_torch_model(base_type),
+                    imgsz=config.get('processing.imgsz', 640),
+                    intra_op_threads=config.get('models.intra_op_threads', 0)
+                )
             except Exception as e:
-                print(f"Info: Could not move model {model_type} to GPU: {e}")
+                print(f"Info: {backend} backend unavailable for {model_type}, using PyTorch: {e}")
 
-            models[model_type] = model
-        except Exception as e:
-            print(f"Error load model {model_type}: {e}")
+        if model is None:
+            model = _load_torch_model(base_type)
+            if variant == 'fp16':
+                # FP16 only pays off (and is only supported) on CUDA
+                model.half_precision = _on_gpu(model)
+                if not model.half_precision:
+                    print(f"Info: {model_type} has no GPU, running FP32")
+        return model
+    except Exception as e:
+        print(f"Error load model {model_type}: {e}")
+        raise
+
+
+class ModelPool:
+    """Up to ``size`` instances of one model, lent out one caller at a time.
+
+    The first instance is loaded (and warmed up) on construction; the rest
+    are created on demand when every existing instance is busy. Callers that
+    find the pool full wait for an instance to be returned.
+    """
+
+    def __init__(self, model_type, size=1):
+        self.model_type = model_type
+        self.size = max(1, int(size))
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reserve()
+        self.primary = self._new_instance()
+        self._idle.put(self.primary)
+
+    def _reserve(self):
+        """Claim a slot for one more instance; False when the pool is full.
+
+        Checked and counted under one lock, so concurrent callers can never
+        load more than ``size`` instances between them.
+        """
+        with self._lock:
+            if self._created >= self.size:
+                return False
+            self._created += 1
+            return True
+
+    def _new_instance(self):
+        """Load an instance into a slot taken with _reserve(); the slot is
+        given back if loading fails"""
+        try:
+            model = _load_model(self.model_type)
+            warm_up(model)
+            return model
+        except Exception:
+            with self._lock:
+                self._created -= 1
             raise
-    return models[model_type]
+
+    def fill(self):
+        """Create the remaining instances now instead of on first contention"""
+        while self._reserve():
+            self._idle.put(self._new_instance())
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        try:
+            model = self._idle.get_nowait()
+        except queue.Empty:
+            model = self._new_instance() if self._reserve() else self._idle.get(timeout=timeout)
+        try:
+            yield model
+        finally:
+            self._idle.put(model)
+
+
+def get_pool(model_type=None):
+    """Return the ModelPool for model_type, loading it exactly once.
+
+    Loads are serialized per model type, so concurrent first requests wait
+    for the same load instead of each reading the weights.
+    """
+    model_type = _resolve_type(model_type)
+    pool = pools.get(model_type)
+    if pool is not None:
+        return pool
+
+    with _registry_lock:
+        lock = _load_locks.setdefault(model_type, threading.Lock())
+    with lock:
+        pool = pools.get(model_type)
+        if pool is None:
+            pool = ModelPool(model_type, size=_pool_size or config.get('models.pool_size', 2))
+            pools[model_type] = pool
+            models[model_type] = pool.primary
+    return pool
 
 
-def infer_frame(model, frame, conf=0.5):
+def set_pool_size(size):
+    """Instances per model type for pools created from now on in this process.
+
+    Job worker processes use 1: each runs one job at a time, and a pool per
+    worker would multiply memory by the number of workers.
+    """
+    global _pool_size
+    _pool_size = max(1, int(size))
+
+
+def get_model(model_type=None):
+    """Get atau load model YOLOv8 atau RT-DETR.
+
+    model_type may carry a precision variant suffix, e.g. 'v8-int8'
+    (dynamic INT8 ONNX on CPU) or 'v8-fp16' (half precision on GPU).
+    Returns the pool's primary instance, shared by all callers; use
+    acquire_model() to run inference without sharing an instance.
+    """
+    return get_pool(model_type).primary
+
+
+def acquire_model(model_type=None, timeout=None):
+    """Context manager lending one pooled instance of model_type exclusively"""
+    return get_pool(model_type).acquire(timeout=timeout)
+
+
+def warm_up(model):
+    """Run one dummy inference so the first real request skips lazy init"""
+    size = config.get('processing.imgsz', 640)
+    infer_batch(model, [np.zeros((size, size, 3), dtype=np.uint8)], batch_size=1)
+
+
+def warm_up_models(model_types=None, background=False):
+    """Load, warm up and fill the pools of model_types (default models.warmup)"""
+    if model_types is None:
+        model_types = config.get('models.warmup', [config.get('models.default', 'v8')]) or []
+
+    def _run():
+        for model_type in model_types:
+            try:
+                get_pool(model_type).fill()
+                print(f"Model {model_type} ready")
+            except Exception as e:
+                print(f"Warm-up failed for {model_type}: {e}")
+
+    if background:
+        threading.Thread(target=_run, daemon=True, name="model-warmup").start()
+    else:
+        _run()
+
+
+def _on_gpu(model):
+    try:
+        return next(model.model.parameters()).is_cuda
+    except Exception:
+        return False
+
+
+def _empty_result(frame):
+    from ultralytics.engine.results import Results
+    return Results(orig_img=frame, path=None, names=[], boxes=[])
+
+
+def infer_frame(model, frame, conf=None):
     """Standard inference wrapper for YOLO11/YOLOv8/RT-DETR.
     Tuned for MAXIMUM detection quality.
     """
-    try:
-        # Standard procedure for high-quality environmental monitoring:
-        # 1. Use official default confidence (0.25) as baseline for all models
-        # 2. Use full precision (FP32) to ensure small trash particles are not missed
-        # 3. Use standard resolution (imgsz=640)
-        target_conf = 0.25 
-        target_half = False # Full FP32 precision for all models now
-        
-        # Using model.predict() is the formal procedure for passing arguments
-        results = model.predict(
-            frame, 
-            verbose=False, 
-            conf=target_conf, 
-            half=target_half,
-            imgsz=640
-        )
-        
-        if not isinstance(results, (list, tuple)):
-            results = [results]
-        return results
-    except Exception as e:
-        print(f"Inference error: {e}")
-        import traceback
-        traceback.print_exc()
-        # Return empty result to continue processing
-        from ultralytics.engine.results import Results
-        return [Results(orig_img=frame, path=None, names=[], boxes=[])]
+    return infer_batch(model, [frame], batch_size=1, conf=conf)
+
+
+def infer_batch(model, frames, batch_size=None, conf=None):
+    """Run inference on many frames with one model.predict() call per chunk.
+
+    Returns one Results per input frame, in order. Batching amortizes the
+    per-call pre/post-processing overhead that dominates on CPU.
+    conf defaults to processing.inference_conf; precision follows the
+    loaded model variant (FP16 only for '-fp16' models on GPU).
+    """
+    if batch_size is None:
+        batch_size = config.get('processing.batch_size', 4)
+    batch_size = max(1, int(batch_size))
+    if conf is None:
+        conf = config.get('processing.inference_conf', 0.25)
+
+    target_half = bool(getattr(model, 'half_precision', False))
+    imgsz = config.get('processing.imgsz', 640)
+
+    all_results = []
+    for start in range(0, len(frames), batch_size):
+        chunk = list(frames[start:start + batch_size])
+        try:
+            # Using model.predict() is the formal procedure for passing arguments
+            results = model.predict(
+                chunk if len(chunk) > 1 else chunk[0],
+                verbose=False,
+                conf=conf,
+                half=target_half,
+                imgsz=imgsz
+            )
+
+            if not isinstance(results, (list, tuple)):
+                results = [results]
+            all_results.extend(results)
+        except Exception as e:
+            print(f"Inference error: {e}")
+            import traceback
+            traceback.print_exc()
+            # Return empty results to continue processing
+            all_results.extend(_empty_result(f) for f in chunk)
+    return all_results
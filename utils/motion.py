@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+from .config_loader import config
+
+
+class MotionGate:
+    """Decides whether a detector frame is worth running inference on.
+
+    Each frame is reduced to a small grayscale thumbnail (area-averaged,
+    so sediment specks and sensor noise mostly vanish) and compared with
+    the thumbnail of the last frame that was actually detected. The frame
+    counts as static when fewer than ``threshold`` (fraction of the
+    thumbnail) pixels changed by more than ``pixel_delta`` gray levels;
+    its detections can then be reused. Comparing against the last detected
+    frame rather than the previous one means slow drift still adds up to a
+    detection, and ``max_skip`` forces one after that many static frames
+    in a row in any case.
+    """
+
+    def __init__(self, threshold=0.005, pixel_delta=20, max_skip=15, width=64):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_skip = max(0, int(max_skip))
+        self.width = width
+        self.reference = None
+        self.run = 0       # static frames since the last detected one
+        self.checked = 0   # frames seen by the gate
+        self.skipped = 0   # frames whose inference was skipped
+
+    def thumbnail(self, image):
+        h, w = image.shape[:2]
+        size = (self.width, max(1, round(h * self.width / w)))
+        small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def changed(self, image):
+        """True if image needs inference; False to reuse the last detections"""
+        thumb = self.thumbnail(image)
+        self.checked += 1
+        if (self.reference is not None and self.run < self.max_skip
+                and thumb.shape == self.reference.shape):
+            moved = np.count_nonzero(cv2.absdiff(thumb, self.reference) > self.pixel_delta)
+            if moved < self.threshold * thumb.size:
+                self.run += 1
+                self.skipped += 1
+                return False
+        self.reference = thumb
+        self.run = 0
+        return True
+
+
+def create_motion_gate(enabled):
+    """MotionGate configured from processing.motion_gate_*, or None when disabled"""
+    if not enabled:
+        return None
+    return MotionGate(
+        threshold=config.get('processing.motion_gate_threshold', 0.005),
+        pixel_delta=config.get('processing.motion_gate_pixel_delta', 20),
+        max_skip=config.get('processing.motion_gate_max_skip', 15),
+    )
@@ -0,0 +1,117 @@
+import queue
+import threading
+
+_END = object()
+
+
+class _Failure:
+    """Carries an exception raised inside a stage down to the consumer"""
+    def __init__(self, error):
+        self.error = error
+
+
+class Pipeline:
+    """Producer/consumer chain of threaded stages joined by bounded queues.
+
+    ``source`` is an iterable consumed on its own thread; every callable in
+    ``stages`` runs on a dedicated thread and maps one item to one item.
+    Iterating the pipeline yields the last stage's outputs in source order,
+    so the caller's loop acts as the final stage. Bounded queues keep at
+    most ``maxsize`` items in flight between two stages. OpenCV decode,
+    inference and encode release the GIL, so the stages genuinely overlap.
+    ``interrupt`` (optional callable) is run by close() to unblock a source
+    stuck waiting on its input, e.g. PipeCapture.interrupt.
+    """
+
+    def __init__(self, source, stages=(), maxsize=4, name="pipeline", interrupt=None):
+        self.source = source
+        self.stages = list(stages)
+        self.maxsize = max(1, int(maxsize))
+        self.name = name
+        self.interrupt = interrupt
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
+
+    def _run_source(self, out_q):
+        try:
+            for item in self.source:
+                if not self._put(out_q, item):
+                    return
+        except Exception as e:
+            self._put(out_q, _Failure(e))
+            return
+        self._put(out_q, _END)
+
+    def _run_stage(self, fn, in_q, out_q):
+        while True:
+            item = self._get(in_q)
+            if item is _END or isinstance(item, _Failure):
+                self._put(out_q, item)
+                return
+            try:
+                result = fn(item)
+            except Exception as e:
+                self._put(out_q, _Failure(e))
+                return
+            if not self._put(out_q, result):
+                return
+
+    def _start(self):
+        queues = [queue.Queue(maxsize=self.maxsize) for _ in range(len(self.stages) + 1)]
+        self._threads = [threading.Thread(target=self._run_source, args=(queues[0],),
+                                          name=f"{self.name}-source", daemon=True)]
+        for i, fn in enumerate(self.stages):
+            self._threads.append(threading.Thread(target=self._run_stage, args=(fn, queues[i], queues[i + 1]),
+                                                  name=f"{self.name}-stage{i + 1}", daemon=True))
+        for t in self._threads:
+            t.start()
+        return queues[-1]
+
+    def __iter__(self):
+        out_q = self._start()
+        try:
+            while True:
+                item = self._get(out_q)
+                if item is _END:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            self.close()
+
+    def close(self, timeout=5):
+        """Stop all stages, interrupt the source and wait for the threads.
+
+        Returns True when every thread has exited within timeout seconds
+        each, i.e. it is safe to release what the source was reading.
+        """
+        self._stop.set()
+        if self.interrupt is not None:
+            try:
+                self.interrupt()
+            except Exception as e:
+                print(f"{self.name}: interrupting the source failed: {e}")
+        stopped = True
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(timeout=timeout)
+                stopped = stopped and not t.is_alive()
+        return stopped
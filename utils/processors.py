@@ -4,16 +4,22 @@ import time
 import json
 from flask import jsonify
 from .config_loader import config
-from .model import infer_frame
-from .tracking import CentroidTracker
+from .model import infer_frame, infer_batch
+from .tracking import create_tracker
+from .detections import extract_detections
+from .tiling import infer_tiled
+from .annotation import get_renderer
 
-def process_image(model, input_path, output_path):
+def process_image(model, input_path, output_path, tiled=False):
     """Process gambar dan return raw data"""
     try:
         img = cv2.imread(input_path)
         if img is None:
             return 0, {}
         
+        if tiled:
+            return _process_image_tiled(model, img, output_path)
+
         # Use same inference method as video for consistency
         results = infer_frame(model, img, conf=config.get('processing.inference_conf', 0.25))
         
@@ -24,29 +30,32 @@ def process_image(model, input_path, output_path):
         cv2.imwrite(output_path, annotated_img)
         
         # Count objects per class
+        names = model.names if hasattr(model, 'names') and model.names else None
+        dets = extract_detections(results[0], names)
         class_counts = {}
-        if results[0].boxes:
-            try:
-                for box in results[0].boxes:
-                    class_id = int(box.cls[0])
-                    # Try different ways to get class name
-                    if hasattr(model, 'names') and model.names:
-                        class_name = model.names.get(class_id, f'Class {class_id}') if isinstance(model.names, dict) else model.names[class_id]
-                    elif hasattr(results[0], 'names') and results[0].names:
-                        class_name = results[0].names.get(class_id, f'Class {class_id}') if isinstance(results[0].names, dict) else results[0].names[class_id]
-                    else:
-                        class_name = f'Class {class_id}'
-                    
-                    class_counts[class_name] = class_counts.get(class_name, 0) + 1
-            except Exception as e:
-                print(f"Error counting classes: {e}")
-                class_counts = {}
+        for class_name in dets['labels']:
+            class_counts[class_name] = class_counts.get(class_name, 0) + 1
         
-        return (len(results[0].boxes) if results[0].boxes else 0), class_counts
+        return len(dets['labels']), class_counts
     except Exception as e:
         print(f"process_image error: {e}")
         return 0, {}
 
+def _process_image_tiled(model, img, output_path):
+    """Tiled inference (see utils/tiling.py), boxes drawn on the original image"""
+    h, w = img.shape[:2]
+    max_width = config.get('processing.tile_max_width', 1920)
+    scale = min(1.0, max_width / w)
+    inf_img = cv2.resize(img, (max_width, int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1.0 else img
+    dets = infer_tiled(model, [inf_img], conf=config.get('processing.inference_conf', 0.25))[0]
+    get_renderer().draw_boxes(img, dets['xyxy'], dets['labels'], dets['conf'].tolist(), scale=1.0 / scale)
+    cv2.imwrite(output_path, img)
+
+    class_counts = {}
+    for class_name in dets['labels']:
+        class_counts[class_name] = class_counts.get(class_name, 0) + 1
+    return len(dets['labels']), class_counts
+
 def process_video(filepath, model, timestamp, output_folder):
     """Process video dengan centroid tracking untuk avoid double counting"""
     try:
@@ -64,76 +73,72 @@ def process_video(filepath, model, timestamp, output_folder):
         prev_time = time.time()
         
         # Tracking untuk unique objects per class
-        ct = CentroidTracker(max_disappeared=40, max_distance=50)
+        ct = create_tracker(max_disappeared=40, max_distance=50)
         unique_objects = {}  # {class_name: set of object IDs}
         class_counts = {}    # {class_name: count of unique objects}
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
+        batch_size = max(1, int(config.get('processing.batch_size', 4)))
+        names = model.names if hasattr(model, 'names') and model.names else None
+        end_of_stream = False
+        
+        while not end_of_stream:
+            # Accumulate a batch of decoded frames
+            frames = []
+            while len(frames) < batch_size:
+                ret, frame = cap.read()
+                if not ret:
+                    end_of_stream = True
+                    break
+                frames.append(frame)
+            if not frames:
                 break
             
-            # Predict - use robust wrapper to support both v8 and v6
-            results = infer_frame(model, frame, conf=0.5)
-            annotated_frame = results[0].plot()
+            # Predict - one batched call for the whole chunk
+            batch_results = infer_batch(model, frames, batch_size=batch_size, conf=config.get('processing.inference_conf', 0.25))
             
             # Hitung FPS (sesuai yolov8.py)
             curr_time = time.time()
             dt = curr_time - prev_time if curr_time - prev_time > 0 else 1e-6
-            fps_display = 1.0 / dt
+            fps_display = len(frames) / dt
             prev_time = curr_time
             
-            # Draw FPS
-            cv2.putText(annotated_frame, f"FPS: {fps_display:.1f}", (10, 30), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-            
-            # Group current detections by class with centroid tracking
-            rects = []
-            input_class_names = []
-            
-            if results and len(results) > 0 and results[0].boxes:
-                for box in results[0].boxes:
-                    try:
-                        coords = box.xyxy[0].cpu().numpy().astype(int)
-                        x1, y1, x2, y2 = coords
-                        cls_id = int(box.cls[0])
-                        
-                        # Get class name
-                        if hasattr(model, 'names') and model.names:
-                            class_name = model.names.get(class_id, f'Class {class_id}') if isinstance(model.names, dict) else model.names[cls_id]
-                        elif hasattr(results[0], 'names') and results[0].names:
-                            class_name = results[0].names.get(class_id, f'Class {class_id}') if isinstance(results[0].names, dict) else results[0].names[class_id]
-                        else:
-                            class_name = f'Class {class_id}'
-                        
-                        rects.append((x1, y1, x2, y2))
-                        input_class_names.append(class_name)
-                    except Exception:
-                        continue
-            
-            # Update Tracker
-            objects, obj_class_names = ct.update(rects, input_class_names)
-            
-            # Update Stats and Draw ID on annotated_frame (from plot)
-            for (objectID, centroid) in objects.items():
-                # Update stats
-                class_name = obj_class_names.get(objectID, "Unknown")
-                if class_name not in unique_objects:
-                    unique_objects[class_name] = set()
+            for result in batch_results:
+                results = [result]
+                annotated_frame = results[0].plot()
                 
-                unique_objects[class_name].add(objectID)
-                class_counts[class_name] = len(unique_objects[class_name])
+                # Draw FPS
+                cv2.putText(annotated_frame, f"FPS: {fps_display:.1f}", (10, 30), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
                 
-                # Draw ID - Thinner
-                # Only draw if the object is currently detected (disappeared == 0)
-                if ct.disappeared[objectID] == 0:
-                    text = f"ID {objectID}"
-                    cv2.putText(annotated_frame, text, (centroid[0] - 10, centroid[1] - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
-                    cv2.circle(annotated_frame, (centroid[0], centroid[1]), 3, (0, 255, 0), -1)
-            
-            out.write(annotated_frame)
-            frame_count += 1
+                # Group current detections by class with centroid tracking
+                dets = extract_detections(results[0], names)
+                rects = dets['xyxy'].astype(int)
+                input_class_names = dets['labels']
+                
+                # Update Tracker
+                objects, obj_class_names = ct.update(rects, input_class_names)
+                disappeared = ct.disappeared
+                
+                # Update Stats and Draw ID on annotated_frame (from plot)
+                for (objectID, centroid) in objects.items():
+                    # Update stats
+                    class_name = obj_class_names.get(objectID, "Unknown")
+                    if class_name not in unique_objects:
+                        unique_objects[class_name] = set()
+                    
+                    unique_objects[class_name].add(objectID)
+                    class_counts[class_name] = len(unique_objects[class_name])
+                    
+                    # Draw ID - Thinner
+                    # Only draw if the object is currently detected (disappeared == 0)
+                    if disappeared[objectID] == 0:
+                        text = f"ID {objectID}"
+                        cv2.putText(annotated_frame, text, (centroid[0] - 10, centroid[1] - 10),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+                        cv2.circle(annotated_frame, (centroid[0], centroid[1]), 3, (0, 255, 0), -1)
+                
+                out.write(annotated_frame)
+                frame_count += 1
         
         cap.release()
         out.release()
@@ -0,0 +1,152 @@
+import numpy as np
+from .config_loader import config
+from .model import infer_batch
+from .detections import extract_detections, empty_detections
+
+
+def tile_origins(length, tile, overlap):
+    """Start offsets of tiles of size tile along length, overlapping by at
+    least overlap (fraction); the last tile ends exactly at length"""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1.0 - overlap)))
+    count = int(np.ceil((length - tile) / stride)) + 1
+    return np.linspace(0, length - tile, count).astype(int).tolist()
+
+
+class TileSpec:
+    """How a frame is cut: processing.tile_size tiles overlapping by
+    processing.tile_overlap, plus (tile_full_frame) one view of the whole
+    frame so objects larger than a tile are still seen in one piece"""
+
+    def __init__(self, tile_size=640, overlap=0.2, full_frame=True, nms_threshold=0.5, metric='ios'):
+        self.tile_size = int(tile_size)
+        self.overlap = float(overlap)
+        self.full_frame = full_frame
+        self.nms_threshold = nms_threshold
+        self.metric = metric
+
+    def windows(self, width, height):
+        """(x0, y0, x1, y1) of every tile of a width x height frame"""
+        t = self.tile_size
+        return [(x, y, min(x + t, width), min(y + t, height))
+                for y in tile_origins(height, t, self.overlap)
+                for x in tile_origins(width, t, self.overlap)]
+
+    def slice(self, frame):
+        """Tile images (views, no copies) and their windows; the full-frame
+        view, when added, is the last one and spans the whole frame"""
+        h, w = frame.shape[:2]
+        windows = self.windows(w, h)
+        if self.full_frame and len(windows) > 1:
+            windows.append((0, 0, w, h))
+        return [frame[y0:y1, x0:x1] for x0, y0, x1, y1 in windows], windows
+
+
+def get_tile_spec():
+    return TileSpec(
+        tile_size=config.get('processing.tile_size', 640),
+        overlap=config.get('processing.tile_overlap', 0.2),
+        full_frame=config.get('processing.tile_full_frame', True),
+        nms_threshold=config.get('processing.tile_nms_threshold', 0.5),
+        metric=config.get('processing.tile_nms_metric', 'ios'),
+    )
+
+
+def overlap_matrix(a, b, metric='iou'):
+    """Pairwise overlap of (N, 4) and (M, 4) xyxy boxes in one broadcast.
+
+    'iou' is intersection over union; 'ios' is intersection over the
+    smaller box, which also pairs a box cut off at a tile edge with the
+    complete box of the same object from the neighbouring tile.
+    """
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    if metric == 'ios':
+        denom = np.minimum(area_a[:, None], area_b[None, :])
+    else:
+        denom = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(denom, 1e-9)
+
+
+def nms(boxes, scores, classes, threshold=0.5, metric='iou'):
+    """Indices of boxes kept by class-aware greedy NMS, best score first.
+
+    The overlap matrix of all boxes is computed once; the greedy pass then
+    only ORs precomputed rows of kept boxes together.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(-scores, kind='stable')
+    b = boxes[order]
+    c = classes[order]
+    clash = (overlap_matrix(b, b, metric) > threshold) & (c[:, None] == c[None, :])
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1:] &= ~clash[i, i + 1:]
+    return order[keep]
+
+
+def merge_detections(parts, threshold=0.5, metric='ios'):
+    """Concatenate detection dicts (already in frame coordinates) and drop
+    the cross-tile duplicates with nms()"""
+    parts = [p for p in parts if len(p['labels'])]
+    if not parts:
+        return empty_detections()
+    xyxy = np.concatenate([p['xyxy'] for p in parts])
+    conf = np.concatenate([p['conf'] for p in parts])
+    cls = np.concatenate([p['cls'] for p in parts])
+    labels = [label for p in parts for label in p['labels']]
+    keep = nms(xyxy, conf, cls, threshold, metric)
+    return {
+        'xyxy': np.ascontiguousarray(xyxy[keep]),
+        'conf': conf[keep],
+        'cls': cls[keep],
+        'labels': [labels[i] for i in keep.tolist()]
+    }
+
+
+def infer_tiled(model, frames, spec=None, conf=None, names=None, batch_size=None):
+    """Sliced inference over several frames with one infer_batch call.
+
+    Tiles of all frames are batched together (batch_size, default
+    processing.tile_batch_size, tiles per predict call), so the fixed
+    per-call cost is shared and the model sees tile-sized inputs at
+    (close to) native resolution instead of one downscaled frame. Returns
+    one detection dict per frame, in frame coordinates, merged across
+    tiles with class-aware NMS.
+    """
+    spec = spec or get_tile_spec()
+    tiles, owners = [], []
+    for i, frame in enumerate(frames):
+        views, windows = spec.slice(frame)
+        tiles.extend(views)
+        owners.extend((i, window) for window in windows)
+    if not tiles:
+        return []
+    if names is None:
+        names = getattr(model, 'names', None)
+    if batch_size is None:
+        batch_size = config.get('processing.tile_batch_size', 16)
+    results = infer_batch(model, tiles, batch_size=batch_size, conf=conf)
+
+    parts = [[] for _ in frames]
+    for (i, (x0, y0, _, _)), result in zip(owners, results):
+        dets = extract_detections(result, names)
+        if len(dets['labels']) and (x0 or y0):
+            dets['xyxy'] = dets['xyxy'] + np.array([x0, y0, x0, y0], dtype=np.float32)
+        parts[i].append(dets)
+    return [merge_detections(p, spec.nms_threshold, spec.metric) for p in parts]
+
+
+def scale_detections(dets, scale):
+    """dets with boxes multiplied by scale (e.g. back to source resolution)"""
+    if scale == 1.0 or len(dets['labels']) == 0:
+        return dets
+    return dict(dets, xyxy=dets['xyxy'] * np.float32(scale))
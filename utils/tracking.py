@@ -1,16 +1,95 @@
 import numpy as np
 from collections import OrderedDict
 
+from .config_loader import config
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+def pairwise_distances(a, b):
+    """Euclidean distance matrix between two (N, 2) / (M, 2) point arrays"""
+    diff = np.asarray(a, dtype=float)[:, None, :] - np.asarray(b, dtype=float)[None, :, :]
+    return np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+
+
+def iou_matrix(a, b):
+    """IoU between every box in a (N, 4) and b (M, 4), boxes as x1, y1, x2, y2"""
+    a = np.asarray(a, dtype=float).reshape(-1, 4)
+    b = np.asarray(b, dtype=float).reshape(-1, 4)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def greedy_match(D, max_distance):
+    """Greedy row/col matching: rows with the closest candidate pick first.
+
+    Returns (rows, cols) index arrays of accepted pairs.
+    """
+    # In order to perform this matching we must (1) find the
+    # smallest value in each row and then (2) sort the row
+    # indexes based on their minimum values so that the row
+    # with the smallest value is at the *front* of the index
+    # list; each row proposes its nearest column
+    rows = D.min(axis=1).argsort()
+    cols = D.argmin(axis=1)[rows]
+
+    # Drop pairs beyond the gate up front, then resolve column
+    # conflicts in row order - only the first claim on a column wins
+    keep = D[rows, cols] <= max_distance
+    rows, cols = rows[keep], cols[keep]
+    _, first = np.unique(cols, return_index=True)
+    first.sort()
+    return rows[first], cols[first]
+
+
+def hungarian_match(D, max_distance):
+    """Globally optimal assignment (minimum total distance) under the gate"""
+    if linear_sum_assignment is None:
+        return greedy_match(D, max_distance)
+    # Gated pairs get a prohibitive cost so they are only chosen when
+    # nothing else is possible, then filtered out afterwards
+    cost = np.where(D > max_distance, max_distance * 1e3 + 1.0, D)
+    rows, cols = linear_sum_assignment(cost)
+    keep = D[rows, cols] <= max_distance
+    return rows[keep], cols[keep]
+
+
 class CentroidTracker:
-    def __init__(self, max_disappeared=50, max_distance=50):
-        # Initialize the next unique object ID along with two ordered
-        # dictionaries used to keep track of mapping a given object
-        # ID to its centroid and number of consecutive frames it has
-        # been marked as "disappeared", respectively
+    """Centroid tracker with class-aware association.
+
+    Tracked state lives in parallel NumPy arrays (one row per live object)
+    instead of per-object dictionaries, so matching, ageing and pruning are
+    array operations. The dictionary views (objects, disappeared,
+    class_names, rects, velocities) are built on demand for callers.
+    """
+
+    def __init__(self, max_disappeared=50, max_distance=50, matcher='greedy', class_aware=True):
+        # Initialize the next unique object ID
         self.next_object_id = 0
-        self.objects = OrderedDict()
-        self.disappeared = OrderedDict()
-        self.class_names = OrderedDict() # Store class name for each object ID
+
+        # One row per tracked object: ID, centroid, last bounding box,
+        # centroid displacement per update, consecutive frames marked as
+        # "disappeared" and class index
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._centroids = np.zeros((0, 2), dtype=np.int64)
+        self._rects = np.zeros((0, 4), dtype=float)
+        self._velocities = np.zeros((0, 2), dtype=float)
+        self._disappeared = np.zeros(0, dtype=np.int64)
+        self._class_ids = np.zeros(0, dtype=np.int64)
+
+        # Class names are interned to small integers for vectorized compares
+        self._class_list = []
+        self._class_index = {}
 
         # Store the number of maximum consecutive frames a given
         # object is allowed to be marked as "disappeared" until we
@@ -18,153 +97,378 @@ class CentroidTracker:
         self.max_disappeared = max_disappeared
         self.max_distance = max_distance
 
-    def register(self, centroid, class_name):
+        # 'greedy' (nearest-first) or 'hungarian' (optimal assignment,
+        # needs scipy; falls back to greedy without it)
+        self.matcher = hungarian_match if matcher == 'hungarian' else greedy_match
+
+        # When class aware, a detection can only continue a track of the
+        # same class, so e.g. a passing fish cannot steal a bottle's ID
+        self.class_aware = class_aware
+
+    # Dictionary views keyed by object ID (in registration order)
+    @property
+    def objects(self):
+        return OrderedDict(zip(self._ids.tolist(), self._centroids))
+
+    @property
+    def disappeared(self):
+        return OrderedDict(zip(self._ids.tolist(), self._disappeared.tolist()))
+
+    @property
+    def class_names(self):
+        return OrderedDict((oid, self._class_list[cid]) for oid, cid in zip(self._ids.tolist(), self._class_ids.tolist()))
+
+    @property
+    def rects(self):
+        return OrderedDict(zip(self._ids.tolist(), self._rects))
+
+    @property
+    def velocities(self):
+        return OrderedDict(zip(self._ids.tolist(), self._velocities))
+
+    def _class_id(self, class_name):
+        cid = self._class_index.get(class_name)
+        if cid is None:
+            cid = len(self._class_list)
+            self._class_index[class_name] = cid
+            self._class_list.append(class_name)
+        return cid
+
+    def _append(self, centroids, rects, class_ids):
+        n = len(centroids)
+        if n == 0:
+            return
+        self._ids = np.concatenate([self._ids, np.arange(self.next_object_id, self.next_object_id + n)])
+        self._centroids = np.concatenate([self._centroids, centroids])
+        self._rects = np.concatenate([self._rects, rects])
+        self._velocities = np.concatenate([self._velocities, np.zeros((n, 2))])
+        self._disappeared = np.concatenate([self._disappeared, np.zeros(n, dtype=np.int64)])
+        self._class_ids = np.concatenate([self._class_ids, class_ids])
+        self.next_object_id += n
+
+    def _keep(self, mask):
+        self._ids = self._ids[mask]
+        self._centroids = self._centroids[mask]
+        self._rects = self._rects[mask]
+        self._velocities = self._velocities[mask]
+        self._disappeared = self._disappeared[mask]
+        self._class_ids = self._class_ids[mask]
+
+    def _drop_expired(self):
+        # Deregister objects missing for more than max_disappeared frames
+        expired = self._disappeared > self.max_disappeared
+        if expired.any():
+            self._keep(~expired)
+
+    def register(self, centroid, class_name, rect=None):
         # When registering an object we use the next available object
         # ID to store the centroid
-        self.objects[self.next_object_id] = centroid
-        self.disappeared[self.next_object_id] = 0
-        self.class_names[self.next_object_id] = class_name
-        self.next_object_id += 1
+        centroid = np.asarray(centroid, dtype=np.int64).reshape(1, 2)
+        if rect is None:
+            rect = np.hstack([centroid, centroid])
+        self._append(centroid, np.asarray(rect, dtype=float).reshape(1, 4),
+                     np.array([self._class_id(class_name)], dtype=np.int64))
 
     def deregister(self, object_id):
-        # To deregister an object ID we delete the object ID from
-        # both of our respective dictionaries
-        del self.objects[object_id]
-        del self.disappeared[object_id]
-        del self.class_names[object_id]
+        # To deregister an object ID we drop its row from every array
+        self._keep(self._ids != object_id)
 
     def update(self, rects, class_names_list):
+        boxes = np.asarray(rects, dtype=float).reshape(-1, 4)
+
         # Check to see if the list of input bounding box rectangles
         # is empty
-        if len(rects) == 0:
-            # Loop over any existing tracked object IDs and mark them
-            # as disappeared
-            for object_id in list(self.disappeared.keys()):
-                self.disappeared[object_id] += 1
-
-                # If we have reached a maximum number of consecutive
-                # frames where a given object has been marked as
-                # missing, deregister it
-                if self.disappeared[object_id] > self.max_disappeared:
-                    self.deregister(object_id)
-
-            # Return early as there are no centroids or tracking info
-            # to update
+        if len(boxes) == 0:
+            # Mark every tracked object as disappeared and deregister
+            # those missing for too long
+            self._disappeared += 1
+            self._drop_expired()
             return self.objects, self.class_names
 
-        # Initialize an array of input centroids for the current frame
-        input_centroids = np.zeros((len(rects), 2), dtype="int")
-
-        # Loop over the bounding box rectangles
-        for (i, (startX, startY, endX, endY)) in enumerate(rects):
-            # Use the bounding box coordinates to derive the centroid
-            cX = int((startX + endX) / 2.0)
-            cY = int((startY + endY) / 2.0)
-            input_centroids[i] = (cX, cY)
+        # Derive all input centroids at once from the bounding boxes
+        input_centroids = ((boxes[:, :2] + boxes[:, 2:]) / 2.0).astype(np.int64)
+        input_class_ids = np.array([self._class_id(n) for n in class_names_list], dtype=np.int64)
 
         # If we are currently not tracking any objects, take the input
         # centroids and register each of them
-        if len(self.objects) == 0:
-            for i in range(0, len(input_centroids)):
-                self.register(input_centroids[i], class_names_list[i])
-
-        # Otherwise, are are currently tracking objects so we need to
-        # match the input centroids to existing object centroids
-        else:
-            # Grab the set of object IDs and corresponding centroids
-            object_ids = list(self.objects.keys())
-            object_centroids = list(self.objects.values())
-
-            # Compute the distance between each pair of object
-            # centroids and input centroids, respectively -- our
-            # goal will be to match an input centroid to an existing
-            # object centroid
-            if len(object_ids) > 0 and len(input_centroids) > 0:
-                # Manual Euclidean distance calculation to avoid dependency issues if needed, 
-                # but numpy linalg norm is standard.
-                # Distance matrix: rows = existing objects, cols = input objects
-                D = np.zeros((len(object_ids), len(input_centroids)))
-                for i in range(len(object_ids)):
-                    for j in range(len(input_centroids)):
-                        D[i, j] = np.linalg.norm(np.array(object_centroids[i]) - input_centroids[j])
-                
-                # In order to perform this matching we must (1) find the
-                # smallest value in each row and then (2) sort the row
-                # indexes based on their minimum values so that the row
-                # with the smallest value is at the *front* of the index
-                # list
-                rows = D.min(axis=1).argsort()
-
-                # Next, we perform a similar process on the columns by
-                # finding the smallest value in each column and then
-                # sorting using the previously computed row index list
-                cols = D.argmin(axis=1)[rows]
-
-                # In order to determine if we need to update, register,
-                # or deregister an object we need to keep track of which
-                # of the rows and column indexes we have already examined
-                used_rows = set()
-                used_cols = set()
-
-                # Loop over the combination of the (row, column) index
-                # tuples
-                for (row, col) in zip(rows, cols):
-                    # If we have already examined either the row or
-                    # column value before, ignore it
-                    if row in used_rows or col in used_cols:
-                        continue
-
-                    # If the distance between centroids is greater than
-                    # the maximum distance, do not associate the two
-                    # centroids to the same object
-                    if D[row, col] > self.max_distance:
-                        continue
-
-                    # Otherwise, grab the object ID for the current row,
-                    # set its new centroid, and reset the disappeared
-                    # counter
-                    object_id = object_ids[row]
-                    self.objects[object_id] = input_centroids[col]
-                    self.disappeared[object_id] = 0
-                    self.class_names[object_id] = class_names_list[col] # Update class name (optional, usually stays same)
-
-                    # Indicate that we have examined each of the row and
-                    # column indexes, respectively
-                    used_rows.add(row)
-                    used_cols.add(col)
-
-                # Compute both the row and column index we have NOT yet
-                # examined
-                unused_rows = set(range(0, D.shape[0])).difference(used_rows)
-                unused_cols = set(range(0, D.shape[1])).difference(used_cols)
-
-                # In the event that the number of object centroids is
-                # equal or greater than the number of input centroids
-                # we need to check and see if some of these objects have
-                # potentially disappeared
-                if D.shape[0] >= D.shape[1]:
-                    # Loop over the unused row indexes
-                    for row in unused_rows:
-                        object_id = object_ids[row]
-                        self.disappeared[object_id] += 1
-
-                        if self.disappeared[object_id] > self.max_disappeared:
-                            self.deregister(object_id)
-
-                # Otherwise, if the number of input centroids is greater
-                # than the number of existing object centroids we need to
-                # register each new input centroid as a trackable object
-                else:
-                    for col in unused_cols:
-                        self.register(input_centroids[col], class_names_list[col])
-                        
-            # If no existing objects (failsafe, though handled by len(object_ids) check)
-            else:
-                 for i in range(0, len(input_centroids)):
-                    self.register(input_centroids[i], class_names_list[i])
+        if len(self._ids) == 0:
+            self._append(input_centroids, boxes, input_class_ids)
+            return self.objects, self.class_names
+
+        # Distance matrix: rows = existing objects, cols = input objects
+        D = pairwise_distances(self._centroids, input_centroids)
+        if self.class_aware:
+            # Cross-class pairs can never be associated
+            D[self._class_ids[:, None] != input_class_ids[None, :]] = np.inf
+        rows, cols = self.matcher(D, self.max_distance)
+
+        # Matched objects take the new centroid/box and reset the
+        # disappeared counter
+        self._velocities[rows] = input_centroids[cols] - self._centroids[rows]
+        self._centroids[rows] = input_centroids[cols]
+        self._rects[rows] = boxes[cols]
+        self._disappeared[rows] = 0
+        if not self.class_aware:
+            self._class_ids[rows] = input_class_ids[cols]
+
+        # Existing objects without a match may have disappeared
+        unmatched = np.ones(len(self._ids), dtype=bool)
+        unmatched[rows] = False
+        self._disappeared[unmatched] += 1
+        self._drop_expired()
+
+        # Inputs without a match are new trackable objects
+        new = np.ones(len(boxes), dtype=bool)
+        new[cols] = False
+        self._append(input_centroids[new], boxes[new], input_class_ids[new])
 
         # Return the set of trackable objects
-        # We also need to count total unique objects seen across the session?
-        # The class maintains current objects. For a cumulative count, 
-        # the caller needs to track 'next_object_id'.
+        # For a cumulative count, the caller needs to track 'next_object_id'.
         return self.objects, self.class_names
+
+    def predict(self, step=1.0):
+        """Propagate boxes of currently visible objects between updates.
+
+        step is the fraction of one update interval elapsed since the last
+        update() call (e.g. 2/5 on the 2nd skipped frame with stride 5).
+        Boxes are shifted along each object's last centroid displacement;
+        tracker state is left untouched. Returns {object_id: (x1, y1, x2, y2)}.
+        """
+        visible = self._disappeared == 0
+        shift = np.tile(self._velocities[visible] * step, 2)
+        boxes = (self._rects[visible] + shift).astype(int).tolist()
+        return dict(zip(self._ids[visible].tolist(), map(tuple, boxes)))
+
+
+class SortTracker:
+    """SORT-style tracker: constant-velocity Kalman prediction + IoU matching.
+
+    All tracks are predicted and corrected together with batched matrix
+    operations. Each track state is [cx, cy, w, h, vcx, vcy, vw, vh] with
+    velocities per update() call, so camera pans are followed by the
+    prediction instead of spawning new IDs. A track only gets an object ID
+    once it has been matched min_hits times, which keeps one-frame false
+    positives out of the unique counts. Exposes the same interface as
+    CentroidTracker (update/predict/objects/disappeared/class_names).
+    """
+
+    def __init__(self, max_disappeared=50, iou_threshold=0.3, min_hits=3, matcher='greedy', class_aware=True):
+        self.next_object_id = 0
+        self.max_disappeared = max_disappeared
+        self.iou_threshold = iou_threshold
+        self.min_hits = max(1, int(min_hits))
+        self.matcher = hungarian_match if matcher == 'hungarian' else greedy_match
+        self.class_aware = class_aware
+
+        # One row per track; _ids is -1 while a track is still tentative
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._x = np.zeros((0, 8))
+        self._P = np.zeros((0, 8, 8))
+        self._hits = np.zeros(0, dtype=np.int64)
+        self._disappeared = np.zeros(0, dtype=np.int64)
+        self._class_ids = np.zeros(0, dtype=np.int64)
+        self._class_list = []
+        self._class_index = {}
+
+        # Constant-velocity motion model and direct box measurement
+        self._F = np.eye(8)
+        self._F[:4, 4:] = np.eye(4)
+        self._H = np.eye(4, 8)
+        self._Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001, 0.0001])
+        self._R = np.diag([1.0, 1.0, 10.0, 10.0])
+        self._P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4, 1e4])
+
+    def _class_id(self, class_name):
+        cid = self._class_index.get(class_name)
+        if cid is None:
+            cid = len(self._class_list)
+            self._class_index[class_name] = cid
+            self._class_list.append(class_name)
+        return cid
+
+    @staticmethod
+    def _to_xyxy(x):
+        cx, cy, w, h = x[:, 0], x[:, 1], np.maximum(x[:, 2], 1.0), np.maximum(x[:, 3], 1.0)
+        return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    @staticmethod
+    def _to_cxcywh(boxes):
+        return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2,
+                         boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]], axis=1)
+
+    def _confirmed(self):
+        return (self._ids >= 0) & (self._disappeared <= self.max_disappeared)
+
+    @property
+    def objects(self):
+        keep = self._confirmed()
+        centroids = self._x[keep, :2].astype(np.int64)
+        return OrderedDict(zip(self._ids[keep].tolist(), centroids))
+
+    @property
+    def disappeared(self):
+        keep = self._confirmed()
+        return OrderedDict(zip(self._ids[keep].tolist(), self._disappeared[keep].tolist()))
+
+    @property
+    def class_names(self):
+        keep = self._confirmed()
+        return OrderedDict((oid, self._class_list[cid]) for oid, cid in zip(self._ids[keep].tolist(), self._class_ids[keep].tolist()))
+
+    @property
+    def rects(self):
+        keep = self._confirmed()
+        return OrderedDict(zip(self._ids[keep].tolist(), self._to_xyxy(self._x[keep])))
+
+    def _keep(self, mask):
+        self._ids = self._ids[mask]
+        self._x = self._x[mask]
+        self._P = self._P[mask]
+        self._hits = self._hits[mask]
+        self._disappeared = self._disappeared[mask]
+        self._class_ids = self._class_ids[mask]
+
+    def update(self, rects, class_names_list):
+        boxes = np.asarray(rects, dtype=float).reshape(-1, 4)
+        class_ids = np.array([self._class_id(n) for n in class_names_list], dtype=np.int64)
+
+        # 1. Kalman predict for every track at once
+        if len(self._x):
+            self._x = self._x @ self._F.T
+            self._P = self._F @ self._P @ self._F.T + self._Q
+
+        # 2. Associate predicted boxes with detections on 1 - IoU
+        rows = cols = np.zeros(0, dtype=np.int64)
+        if len(self._x) and len(boxes):
+            cost = 1.0 - iou_matrix(self._to_xyxy(self._x), boxes)
+            if self.class_aware:
+                cost[self._class_ids[:, None] != class_ids[None, :]] = np.inf
+            rows, cols = self.matcher(cost, 1.0 - self.iou_threshold)
+
+        # 3. Kalman correct matched tracks
+        if len(rows):
+            z = self._to_cxcywh(boxes[cols])
+            x, P = self._x[rows], self._P[rows]
+            y = z - x[:, :4]
+            S = P[:, :4, :4] + self._R
+            K = P[:, :, :4] @ np.linalg.inv(S)
+            self._x[rows] = x + (K @ y[:, :, None])[:, :, 0]
+            self._P[rows] = P - K @ P[:, :4, :]
+            self._hits[rows] += 1
+            self._disappeared[rows] = 0
+            if not self.class_aware:
+                self._class_ids[rows] = class_ids[cols]
+
+            # Promote tracks that have been seen often enough
+            promote = rows[(self._ids[rows] < 0) & (self._hits[rows] >= self.min_hits)]
+            self._ids[promote] = np.arange(self.next_object_id, self.next_object_id + len(promote))
+            self.next_object_id += len(promote)
+
+        # 4. Age unmatched tracks; tentative tracks die on their first miss
+        unmatched = np.ones(len(self._x), dtype=bool)
+        unmatched[rows] = False
+        self._disappeared[unmatched] += 1
+        self._keep(~(((self._ids < 0) & unmatched) | (self._disappeared > self.max_disappeared)))
+
+        # 5. Start tentative tracks for unmatched detections
+        new = np.ones(len(boxes), dtype=bool)
+        new[cols] = False
+        n = int(new.sum())
+        if n:
+            x0 = np.zeros((n, 8))
+            x0[:, :4] = self._to_cxcywh(boxes[new])
+            ids = np.full(n, -1, dtype=np.int64)
+            if self.min_hits <= 1:
+                ids = np.arange(self.next_object_id, self.next_object_id + n)
+                self.next_object_id += n
+            self._ids = np.concatenate([self._ids, ids])
+            self._x = np.concatenate([self._x, x0])
+            self._P = np.concatenate([self._P, np.repeat(self._P0[None], n, axis=0)])
+            self._hits = np.concatenate([self._hits, np.ones(n, dtype=np.int64)])
+            self._disappeared = np.concatenate([self._disappeared, np.zeros(n, dtype=np.int64)])
+            self._class_ids = np.concatenate([self._class_ids, class_ids[new]])
+
+        return self.objects, self.class_names
+
+    def predict(self, step=1.0):
+        """Kalman-extrapolated boxes of visible confirmed tracks, step updates ahead"""
+        visible = self._confirmed() & (self._disappeared == 0)
+        x = self._x[visible]
+        boxes = self._to_xyxy(x[:, :4] + x[:, 4:] * step).astype(int).tolist()
+        return dict(zip(self._ids[visible].tolist(), map(tuple, boxes)))
+
+
+def create_tracker(engine=None, max_disappeared=50, max_distance=50, detection_stride=1):
+    """Build the tracker selected by processing.tracker ('centroid' or 'sort').
+
+    max_disappeared is given in decoded frames; with a detection stride the
+    tracker only sees every k-th frame, so limits are rescaled per update.
+    """
+    if engine is None:
+        engine = config.get('processing.tracker', 'centroid')
+    detection_stride = max(1, int(detection_stride))
+    max_disappeared = max(1, max_disappeared // detection_stride)
+    matcher = config.get('processing.tracker_matcher', 'greedy')
+    class_aware = config.get('processing.tracker_class_aware', True)
+
+    if engine == 'sort':
+        return SortTracker(
+            max_disappeared=max_disappeared,
+            iou_threshold=config.get('processing.sort_iou_threshold', 0.3),
+            min_hits=config.get('processing.sort_min_hits', 3),
+            matcher=matcher,
+            class_aware=class_aware
+        )
+    return CentroidTracker(max_disappeared=max_disappeared, max_distance=max_distance * detection_stride,
+                           matcher=matcher, class_aware=class_aware)
+
+
+def stitch_track_ids(segments, iou_threshold=0.5):
+    """Reconcile track IDs of video segments that were tracked independently.
+
+    Consecutive segments share a few overlap frames: the previous segment
+    records them as ``tail`` and the next one (tracking them as warm-up) as
+    ``head``, both ``{frame index: {track id: (class name, box)}}``. Tracks
+    whose boxes overlap (IoU, same class) on those frames vote for being
+    the same object; each next-segment ID is linked to its most voted
+    previous ID. Segment IDs must not collide across segments.
+
+    Returns {class name: unique object count} over the ``unique_objects``
+    ({class name: set of IDs}) of all segments after linking.
+    """
+    parent = {}
+
+    def find(x):
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    for prev, nxt in zip(segments, segments[1:]):
+        votes = {}
+        for index, next_tracks in nxt.get('head', {}).items():
+            prev_tracks = prev.get('tail', {}).get(index)
+            if not prev_tracks or not next_tracks:
+                continue
+            prev_ids, next_ids = list(prev_tracks), list(next_tracks)
+            iou = iou_matrix([prev_tracks[i][1] for i in prev_ids], [next_tracks[i][1] for i in next_ids])
+            same_class = (np.array([prev_tracks[i][0] for i in prev_ids])[:, None] ==
+                          np.array([next_tracks[i][0] for i in next_ids])[None, :])
+            cost = np.where(same_class, 1.0 - iou, np.inf)
+            rows, cols = greedy_match(cost, 1.0 - iou_threshold)
+            for r, c in zip(rows.tolist(), cols.tolist()):
+                key = (next_ids[c], prev_ids[r])
+                votes[key] = votes.get(key, 0) + 1
+
+        best = {}
+        for (next_id, prev_id), n in votes.items():
+            if n > best.get(next_id, (None, 0))[1]:
+                best[next_id] = (prev_id, n)
+        for next_id, (prev_id, _) in best.items():
+            parent[find(next_id)] = find(prev_id)
+
+    roots = {}
+    for segment in segments:
+        for class_name, ids in segment.get('unique_objects', {}).items():
+            roots.setdefault(class_name, set()).update(find(i) for i in ids)
+    return {class_name: len(ids) for class_name, ids in roots.items()}
@@ -0,0 +1,421 @@
+import abc
+import queue
+import shutil
+import threading
+import subprocess
+from fractions import Fraction
+import cv2
+import numpy as np
+from .config_loader import config
+
+try:
+    import av
+except ImportError:
+    av = None
+
+_warned_backends = set()
+
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None
+
+
+_ffmpeg_encoders = None
+
+
+def ffmpeg_has_encoder(name):
+    """Whether the ffmpeg binary on PATH was built with encoder name (checked once)"""
+    global _ffmpeg_encoders
+    if _ffmpeg_encoders is None:
+        _ffmpeg_encoders = ''
+        if ffmpeg_available():
+            try:
+                _ffmpeg_encoders = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True,
+                                                  text=True, timeout=10).stdout
+            except Exception as e:
+                print(f"Could not list ffmpeg encoders: {e}")
+    return f" {name} " in _ffmpeg_encoders
+
+
+def scaled_size(width, height, max_width=None):
+    """(width, height) shrunk to at most max_width, aspect kept, even height"""
+    if not max_width or width <= max_width:
+        return width, height
+    return max_width, max(2, int(round(height * max_width / width / 2)) * 2)
+
+
+def probe_video(path):
+    """fps/width/height/frame_count of a (possibly still growing) video file.
+
+    Returns None when OpenCV cannot read the header yet, e.g. an MP4 whose
+    moov atom sits at the end of a partially uploaded file.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if width <= 0 or height <= 0:
+            return None
+        return {
+            'fps': cap.get(cv2.CAP_PROP_FPS) or 30,
+            'width': width,
+            'height': height,
+            'frame_count': max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        }
+    finally:
+        cap.release()
+
+
+class PipeCapture:
+    """cv2.VideoCapture look-alike decoding a byte stream through ffmpeg.
+
+    ``chunks`` (an iterable of bytes, e.g. UploadSession.iter_bytes()) is
+    fed to ``ffmpeg -i pipe:0`` on a background thread and raw BGR frames
+    are read back from its stdout, so decoding can start while the file is
+    still arriving. Only sequentially readable containers work this way
+    (moov-first/fragmented MP4, MKV, AVI); seeking is not supported.
+    Frames wider than max_width are scaled down by ffmpeg. interrupt()
+    (safe from any thread) kills ffmpeg so a read blocked on a stalled
+    upload returns at once; ``stop`` is set as well, and should be the
+    event the chunk iterable watches so the feeder thread stops waiting.
+    """
+
+    def __init__(self, chunks, props, max_width=None, threads=0, stop=None):
+        self.props = props
+        self._stop = stop or threading.Event()
+        self._lock = threading.Lock()
+        self.width, self.height = scaled_size(props['width'], props['height'], max_width)
+        self._frame_bytes = self.width * self.height * 3
+        self.proc = subprocess.Popen(
+            ['ffmpeg', '-loglevel', 'error', '-threads', str(int(threads)), '-i', 'pipe:0',
+             '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{self.width}x{self.height}', 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self._feeder = threading.Thread(target=self._feed, args=(chunks,), daemon=True, name="pipe-feed")
+        self._feeder.start()
+
+    def _feed(self, chunks):
+        try:
+            for chunk in chunks:
+                if self._stop.is_set():
+                    break
+                self.proc.stdin.write(chunk)
+        except (BrokenPipeError, ValueError, OSError):
+            pass
+        finally:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+
+    def isOpened(self):
+        return self.proc.stdout is not None and not self.proc.stdout.closed
+
+    def read(self, image=None):
+        """Next frame; read straight into image when it has the frame's shape"""
+        if image is None or image.shape != (self.height, self.width, 3) or not image.flags.c_contiguous:
+            image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        view = memoryview(image).cast('B')
+        filled = 0
+        while filled < self._frame_bytes:
+            try:
+                n = self.proc.stdout.readinto(view[filled:])
+            except (ValueError, OSError):
+                n = 0  # released from another thread
+            if not n:
+                return False, None
+            filled += n
+        return True, image
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.props['fps']
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.props.get('frame_count', 0)
+        return 0
+
+    def set(self, prop, value):
+        return False
+
+    def interrupt(self):
+        """Stop feeding and kill ffmpeg; a pending read() then returns (False, None)"""
+        self._stop.set()
+        with self._lock:
+            if self.proc.poll() is None:
+                self.proc.kill()
+
+    def release(self):
+        self.interrupt()
+        with self._lock:
+            self.proc.wait()
+            if self.proc.stdout:
+                self.proc.stdout.close()
+
+
+class AVCapture:
+    """cv2.VideoCapture look-alike decoding through FFmpeg via PyAV.
+
+    The codec decodes on several threads (processing.decode_threads, 0 =
+    auto), and frames wider than max_width are scaled down before the
+    YUV->BGR conversion, so a 2K source never exists as a full-size BGR
+    array. read(image) fills image in place when it has the right shape.
+    Reported width/height are those of the returned frames.
+    """
+
+    def __init__(self, path, max_width=None, threads=0):
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+        if threads:
+            self.stream.codec_context.thread_count = int(threads)
+        ctx = self.stream.codec_context
+        self.source_size = (ctx.width, ctx.height)
+        self.width, self.height = scaled_size(ctx.width, ctx.height, max_width)
+        self.fps = float(self.stream.average_rate or self.stream.guessed_rate or 30)
+        self.frame_count = self.stream.frames or (
+            int(float(self.stream.duration * self.stream.time_base) * self.fps) if self.stream.duration else 0)
+        self._start = self.stream.start_time or 0
+        self._skip_before = None
+        self._frames = self.container.decode(self.stream)
+
+    def isOpened(self):
+        return self._frames is not None
+
+    def read(self, image=None):
+        try:
+            frame = next(self._frames)
+            while self._skip_before is not None and frame.pts is not None and frame.pts < self._skip_before:
+                frame = next(self._frames)
+        except (StopIteration, av.error.FFmpegError):
+            return False, None
+        self._skip_before = None
+        if (self.width, self.height) != self.source_size:
+            # Scale the YUV planes first: cheaper than converting full-size BGR and resizing
+            frame = frame.reformat(width=self.width, height=self.height, interpolation='AREA')
+        rgb = frame.reformat(format='bgr24')
+        plane = rgb.planes[0]
+        rows = np.frombuffer(plane, dtype=np.uint8).reshape(self.height, plane.line_size)
+        pixels = rows[:, :self.width * 3].reshape(self.height, self.width, 3)
+        if image is None or image.shape != pixels.shape:
+            return True, pixels.copy()
+        np.copyto(image, pixels)
+        return True, image
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        return 0
+
+    def set(self, prop, value):
+        """Only CAP_PROP_POS_FRAMES: seek to the keyframe before it, then skip ahead"""
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        # Half a frame early, so rounding of pts does not skip the target frame
+        target = self._start + int((int(value) - 0.5) / self.fps / self.stream.time_base)
+        self.container.seek(max(target, self._start), stream=self.stream, backward=True, any_frame=False)
+        self._frames = self.container.decode(self.stream)
+        self._skip_before = target
+        return True
+
+    def release(self):
+        if self._frames is not None:
+            self._frames = None
+            self.container.close()
+
+
+class ThreadedVideoWriter(abc.ABC):
+    """cv2.VideoWriter look-alike that encodes on a background thread.
+
+    write() only queues the frame (blocking once processing.writer_queue_size
+    frames are pending), so encoding overlaps with inference instead of
+    running inside the frame loop. Queued frames are encoded later, so they
+    must not be modified after write(). Encoder errors are printed once and
+    the remaining frames are dropped; release() flushes and waits.
+    Odd widths/heights are cropped by one pixel (yuv420p needs even sizes).
+    Subclasses provide the encoder through _open, _encode and _finish.
+    """
+
+    def __init__(self, path, fps, size, queue_size=8):
+        self.path = path
+        self.fps = fps
+        self.width, self.height = size[0] - size[0] % 2, size[1] - size[1] % 2
+        self.error = None
+        self._open()
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = threading.Thread(target=self._run, daemon=True, name="video-writer")
+        self._thread.start()
+
+    def isOpened(self):
+        return self._thread is not None
+
+    def write(self, frame):
+        if self._thread is None:
+            return
+        self._queue.put(frame)
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue  # keep draining so write() never blocks on a dead encoder
+            try:
+                self._encode(np.ascontiguousarray(frame[:self.height, :self.width]))
+            except Exception as e:
+                self.error = e
+                print(f"Video encoder error ({self.path}): {e}")
+        try:
+            self._finish()
+        except Exception as e:
+            self.error = self.error or e
+            print(f"Video encoder error ({self.path}): {e}")
+
+    def release(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    @abc.abstractmethod
+    def _open(self):
+        """Start the encoder (called once, from __init__)"""
+
+    @abc.abstractmethod
+    def _encode(self, frame):
+        """Encode one contiguous BGR frame of self.width x self.height (writer thread)"""
+
+    @abc.abstractmethod
+    def _finish(self):
+        """Flush and close the output (writer thread, after the last frame)"""
+
+
+class FFmpegWriter(ThreadedVideoWriter):
+    """H.264 MP4 through an ``ffmpeg`` subprocess fed raw BGR frames on stdin.
+
+    libx264 with processing.encoder_preset/encoder_crf, yuv420p so browsers
+    can play it, and +faststart (moov atom first) so /download/<filename>
+    can start playing before the whole file has arrived.
+    """
+
+    def __init__(self, path, fps, size, preset='veryfast', crf=23, queue_size=8):
+        self.preset, self.crf = preset, crf
+        super().__init__(path, fps, size, queue_size)
+
+    def _open(self):
+        self.proc = subprocess.Popen(
+            ['ffmpeg', '-y', '-loglevel', 'error',
+             '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{self.width}x{self.height}', '-r', str(self.fps),
+             '-i', 'pipe:0', '-an', '-c:v', 'libx264', '-preset', str(self.preset), '-crf', str(self.crf),
+             '-pix_fmt', 'yuv420p', '-movflags', '+faststart', self.path],
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    def _encode(self, frame):
+        self.proc.stdin.write(memoryview(frame).cast('B'))
+
+    def _finish(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        err = self.proc.stderr.read()
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with {self.proc.returncode}: {err.decode(errors='replace').strip()}")
+
+
+class AVWriter(ThreadedVideoWriter):
+    """Same H.264/faststart output as FFmpegWriter, encoded in-process via PyAV"""
+
+    def __init__(self, path, fps, size, preset='veryfast', crf=23, queue_size=8):
+        self.preset, self.crf = preset, crf
+        super().__init__(path, fps, size, queue_size)
+
+    def _open(self):
+        self.container = av.open(self.path, 'w', options={'movflags': '+faststart'})
+        self.stream = self.container.add_stream('libx264', rate=Fraction(self.fps).limit_denominator(1001))
+        self.stream.width, self.stream.height = self.width, self.height
+        self.stream.pix_fmt = 'yuv420p'
+        self.stream.options = {'preset': str(self.preset), 'crf': str(self.crf)}
+
+    def _encode(self, frame):
+        for packet in self.stream.encode(av.VideoFrame.from_ndarray(frame, format='bgr24')):
+            self.container.mux(packet)
+
+    def _finish(self):
+        try:
+            for packet in self.stream.encode():
+                self.container.mux(packet)
+        finally:
+            self.container.close()
+
+
+def open_writer(path, fps, size):
+    """Open an MP4 writer with the configured processing.video_encoder.
+
+    'h264' (default) encodes H.264 on a background thread through the
+    ffmpeg binary, or through PyAV when ffmpeg (with libx264) is not on
+    PATH; 'mp4v' - or neither being available - is the synchronous
+    cv2.VideoWriter with MPEG-4 Part 2, which browsers cannot play inline.
+    """
+    if config.get('processing.video_encoder', 'h264') == 'h264':
+        options = {
+            'preset': config.get('processing.encoder_preset', 'veryfast'),
+            'crf': config.get('processing.encoder_crf', 23),
+            'queue_size': config.get('processing.writer_queue_size', 8),
+        }
+        try:
+            if ffmpeg_has_encoder('libx264'):
+                return FFmpegWriter(path, fps, size, **options)
+            if av is not None and 'libx264' in av.codecs_available:
+                return AVWriter(path, fps, size, **options)
+        except Exception as e:
+            print(f"H.264 writer init error ({e}), using OpenCV mp4v")
+        else:
+            if 'h264' not in _warned_backends:
+                _warned_backends.add('h264')
+                print("Warning: video_encoder 'h264' needs ffmpeg with libx264 on PATH or 'pip install av', "
+                      "using OpenCV mp4v")
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+
+
+def open_capture(path, source=None, max_width=None):
+    """Open path for decoding with the configured processing.decode_backend.
+
+    'opencv' (default) is cv2.VideoCapture; 'pyav' is AVCapture (needs
+    ``pip install av``; falls back to OpenCV when missing). A growing
+    upload (source) is followed through an ffmpeg pipe instead. max_width
+    lets the FFmpeg-based readers decode straight to a smaller size; an
+    OpenCV capture ignores it and returns source-size frames.
+    """
+    threads = config.get('processing.decode_threads', 0)
+    if source is not None and not source.complete:
+        props = probe_video(path)
+        if props is not None and ffmpeg_available():
+            stop = threading.Event()
+            return PipeCapture(source.iter_bytes(stop=stop), props, max_width=max_width, threads=threads, stop=stop)
+    backend = config.get('processing.decode_backend', 'opencv')
+    if backend == 'pyav':
+        if av is None:
+            if backend not in _warned_backends:
+                _warned_backends.add(backend)
+                print("Warning: decode_backend 'pyav' needs 'pip install av', using OpenCV")
+        else:
+            try:
+                return AVCapture(path, max_width=max_width, threads=threads)
+            except Exception as e:
+                print(f"PyAV could not open {path} ({e}), using OpenCV")
+    return cv2.VideoCapture(path)